@@ -0,0 +1,171 @@
+import argparse
+import json
+import sys
+import numpy as np
+import torch
+from scipy.stats import genpareto, kstwo
+from ConditionalSampling import tau_to_val
+from SampleStore import SampleStore
+
+genpareto_params = (1.33, 0, 0.0075761900937239765)
+threshold = -0.946046018600464
+rv = genpareto(*genpareto_params)
+
+
+def exceedance_curve(scores, levels):
+    """
+    Empirical P(score > level) for every level, from one sort of the scores.
+    """
+    scores = np.sort(np.asarray(scores, dtype=np.float64))
+    return 1 - np.searchsorted(scores, np.asarray(levels, dtype=np.float64), side='right') / len(scores)
+
+
+def ks_statistic(x, cdf):
+    """
+    Kolmogorov-Smirnov distance of x to a continuous cdf and its p-value.
+    """
+    u = np.sort(cdf(np.asarray(x, dtype=np.float64)))
+    n = len(u)
+    i = np.arange(1, n + 1)
+    d = max(np.max(i / n - u), np.max(u - (i - 1) / n))
+    return float(d), float(kstwo.sf(d, n))
+
+
+def anderson_darling(x, cdf):
+    """
+    Anderson-Darling A^2 of x against a fully specified continuous cdf,
+    A^2 above 2.49 rejects at the 5% level.
+    """
+    u = np.clip(np.sort(cdf(np.asarray(x, dtype=np.float64))), 1e-12, 1 - 1e-12)
+    n = len(u)
+    i = np.arange(1, n + 1)
+    return float(-n - np.mean((2 * i - 1) * (np.log(u) + np.log1p(-u[::-1]))))
+
+
+def tail_report(scores, rv, threshold, levels=None, periods=(10, 100, 1000, 10000)):
+    """
+    Fit of unconditional scores to the GPD tail above threshold: exceedance
+    rate, KS and Anderson-Darling of the excesses, the exceedance curve given
+    an exceedance, and return levels for return periods counted in samples.
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    excess = scores[scores > threshold] - threshold
+    rate = len(excess) / len(scores)
+    report = {'count': len(scores), 'exceedances': len(excess), 'rate': rate}
+    if len(excess) == 0:
+        return report
+    report['ks'], report['ks_pvalue'] = ks_statistic(excess, rv.cdf)
+    report['anderson_darling'] = anderson_darling(excess, rv.cdf)
+
+    levels = np.asarray(levels if levels is not None else np.quantile(excess, np.linspace(0, 0.999, 50)))
+    report['curve'] = {'level': (levels + threshold).tolist(),
+                       'empirical': exceedance_curve(excess, levels).tolist(),
+                       'model': rv.sf(levels).tolist()}
+
+    # a T-sample return level is exceeded once per T samples on average
+    periods = np.asarray(periods, dtype=np.float64)
+    periods = periods[periods * rate > 1]
+    probs = 1 - 1 / periods
+    report['return_levels'] = {'period': periods.tolist(),
+                               'empirical': np.quantile(scores, probs).tolist(),
+                               'model': (threshold + rv.ppf(1 - 1 / (periods * rate))).tolist()}
+    return report
+
+
+def conditional_report(taus, scores, rv, threshold, c=0.75, k=10):
+    """
+    How closely samples requested at each tau land on their target level
+    rv.ppf(1 - tau / c**k) + threshold, all taus handled in one pass.
+    The achieved tau is the tau whose level equals the sample's score.
+    """
+    taus = np.asarray(taus, dtype=np.float64)
+    scores = np.asarray(scores, dtype=np.float64)
+    levels, inverse = np.unique(taus, return_inverse=True)
+    vals = tau_to_val(levels, rv, threshold, c, k)
+    rel_err = np.abs(scores - vals[inverse]) / np.abs(vals[inverse])
+    achieved = rv.sf(np.maximum(scores - threshold, 0)) * c ** k
+    log_ratio = np.log(np.maximum(achieved, 1e-300) / taus)
+
+    order = np.argsort(inverse, kind='stable')
+    groups = np.split(order, np.cumsum(np.bincount(inverse))[:-1])
+    return {'tau': levels.tolist(),
+            'target': vals.tolist(),
+            'count': [len(g) for g in groups],
+            'mean_score': [float(scores[g].mean()) for g in groups],
+            'mean_rel_err': [float(rel_err[g].mean()) for g in groups],
+            'p90_rel_err': [float(np.quantile(rel_err[g], 0.9)) for g in groups],
+            'median_log_tau_ratio': [float(np.median(log_ratio[g])) for g in groups]}
+
+
+def pggan_maxima(store, dirname, epoch=999, simple=False, batch_size=4096):
+    """
+    Per-sample maximum of the PGGAN fields mapped back through the fitted
+    per-pixel sigma/gamma, for stores written by PGGAN_sampling.py with
+    T the identity. Above a high level its excess is close to Exp(1),
+    the GPD with shape 0 and unit scale.
+    """
+    sigma = torch.load('{}/sigma{}.pt'.format(dirname, epoch), map_location='cpu').numpy().astype(np.float64)
+    gamma = torch.load('{}/gamma{}.pt'.format(dirname, epoch), map_location='cpu').numpy().astype(np.float64)
+    maxima = []
+    for batch in store.iter_batches(batch_size):
+        y = 2 * batch.reshape(len(batch), *sigma.shape).astype(np.float64) - 1
+        if simple:
+            x = y / sigma
+        else:
+            x = (np.log(np.maximum(gamma * y / sigma, 1e-300)) + 1) / gamma
+        maxima.append(x.reshape(len(batch), -1).max(1))
+    return np.concatenate(maxima)
+
+
+def evaluate_store(root, rv=rv, threshold=threshold, c=0.75, k=10, pggan='', epoch=999, simple=False, tail=0.1):
+    """
+    Calibration report of a SampleStore. Only its index is read, except for
+    the PGGAN check, which streams the fields once.
+    """
+    store = SampleStore(root)
+    index = store.index()
+    # the samplers store fields rescaled to [0, 1], the GPD is fitted on [-1, 1]
+    scores = 2 * index['score'].astype(np.float64) - 1
+    conditional = np.isfinite(index['tau'])
+    report = {'store': root}
+    if conditional.any():
+        report['conditional'] = conditional_report(index['tau'][conditional], scores[conditional],
+                                                   rv, threshold, c, k)
+    if (~conditional).any():
+        report['tail'] = tail_report(scores[~conditional], rv, threshold)
+    if pggan:
+        maxima = pggan_maxima(store, pggan, epoch, simple)
+        level = np.quantile(maxima, 1 - tail)
+        report['pggan'] = tail_report(maxima, genpareto(0, 0, 1), level)
+    return report
+
+
+def passes(report, max_rel_err=0.1, min_pvalue=0.01):
+    ok = True
+    if 'conditional' in report:
+        ok &= max(report['conditional']['mean_rel_err']) <= max_rel_err
+    for name in ('tail', 'pggan'):
+        if name in report and 'ks_pvalue' in report[name]:
+            ok &= report[name]['ks_pvalue'] >= min_pvalue
+    return bool(ok)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Calibration')
+    parser.add_argument('--store', required=True, type=str, help='SampleStore folder')
+    parser.add_argument('--c', default=0.75, type=float)
+    parser.add_argument('--k', default=10, type=int)
+    parser.add_argument('--pggan', default='', type=str, help='PGGAN run folder holding sigma/gamma')
+    parser.add_argument('--epoch', default=999, type=int)
+    parser.add_argument('--simple', action='store_true', default=False)
+    parser.add_argument('--max_rel_err', default=0.1, type=float)
+    parser.add_argument('--min_pvalue', default=0.01, type=float)
+    parser.add_argument('--out', default='', type=str, help='report json, defaults to <store>/calibration.json')
+    args = parser.parse_args()
+
+    report = evaluate_store(args.store, c=args.c, k=args.k, pggan=args.pggan, epoch=args.epoch, simple=args.simple)
+    report['passed'] = passes(report, args.max_rel_err, args.min_pvalue)
+    with open(args.out or '{}/calibration.json'.format(args.store), 'w') as f:
+        json.dump(report, f, indent=2)
+    print('passed', report['passed'])
+    sys.exit(0 if report['passed'] else 1)
@@ -0,0 +1,51 @@
+import numpy as np
+import torch
+from RNGStreams import latents
+
+
+def tau_to_val(taus, rv, threshold, c=0.75, k=10):
+    """
+    Extremeness level of every tau: the GPD quantile of the shifted tail, vectorized.
+    """
+    tau_prime = np.asarray(taus, dtype=np.float64) / (c ** k)
+    return rv.ppf(1 - tau_prime) + threshold
+
+
+def generate(G, latentdim, vals, chunk_size=1024, device='cuda', seed=None, offset=0):
+    """
+    One sample of the conditional G per entry of vals, in chunks of chunk_size.
+    With a seed, the latent of entry i is RNGStreams.latents(seed, offset + i).
+    """
+    codes = torch.as_tensor(np.asarray(vals), dtype=torch.float32).view(-1, 1, 1, 1)
+    images = []
+    with torch.no_grad():
+        for i in range(0, len(codes), chunk_size):
+            code = codes[i:i + chunk_size].to(device)
+            if seed is None:
+                latent = torch.randn(len(code), latentdim, 1, 1).to(device)
+            else:
+                latent = latents(seed, np.arange(offset + i, offset + i + len(code)), latentdim).to(device)
+            images.append(G(latent, code).cpu())
+    return torch.cat(images, 0)
+
+
+def sample_taus(G, latentdim, taus, count, rv, threshold, c=0.75, k=10, chunk_size=1024, device='cuda', seed=None):
+    """
+    count samples for every tau, generated in a single chunked pass and
+    returned as a dict tau -> images.
+    """
+    taus = list(taus)
+    vals = tau_to_val(taus, rv, threshold, c, k)
+    images = generate(G, latentdim, np.repeat(vals, count), chunk_size, device, seed)
+    return {tau: images[i * count:(i + 1) * count] for i, tau in enumerate(taus)}
+
+
+def sample_levels(G, latentdim, sample_tau, count, rv, threshold, c=0.75, k=10, chunk_size=1024, device='cuda',
+                  seed=None):
+    """
+    count samples whose tau is drawn from an arbitrary distribution, sample_tau(count)
+    returns the taus; gives back the images and the tau of each.
+    """
+    taus = np.asarray(sample_tau(count))
+    vals = tau_to_val(taus, rv, threshold, c, k)
+    return generate(G, latentdim, vals, chunk_size, device, seed), taus
@@ -8,6 +8,8 @@ from torch.utils.data import Dataset, DataLoader,random_split
 from torch import nn
 import torch.nn.functional as F
 import torch.optim as optim
+from EmbeddingCache import EmbeddingCache
+from Models import ENCODER_CHECKPOINT, ENCODER_DIM
 
 class NWSDataset(Dataset):
     """
@@ -121,7 +123,7 @@ lr= 0.001
 # torch.manual_seed(0)
 
 ### Initialize the two networks
-d = 4
+d = ENCODER_DIM
 
 #model = Autoencoder(encoded_space_dim=encoded_space_dim)
 encoder = Encoder(encoded_space_dim=d,fc2_input_dim=128)
@@ -203,5 +205,11 @@ for epoch in range(num_epochs):
     print('\n EPOCH {}/{} \t train loss {} \t val loss {}'.format(epoch + 1, num_epochs,train_loss,val_loss))
     diz_loss['train_loss'].append(train_loss)
     diz_loss['val_loss'].append(val_loss)
-    torch.save(encoder, 'encoder{}.pt'.format(epoch))
-    torch.save(decoder, 'decoder{}.pt'.format(epoch))
+    torch.save(encoder.state_dict(), 'encoder{}.pt'.format(epoch))
+    torch.save(decoder.state_dict(), 'decoder{}.pt'.format(epoch))
+torch.save(encoder.state_dict(), ENCODER_CHECKPOINT)
+torch.save(decoder.state_dict(), 'decoder999.pt')
+
+### Encode the corpus once with the final encoder, reused by PGGAN_ae.py and NearestNeighbors.py
+embeddings = EmbeddingCache().get(encoder, 'data/real.pt', 'conv{}'.format(d), device=device)
+print('embeddings', embeddings.shape)
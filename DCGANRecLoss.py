@@ -9,6 +9,10 @@ from scipy.stats import genpareto
 import torch.nn.functional as F
 from torch.autograd import Variable
 from torch import FloatTensor
+import argparse
+from EMA import generator_checkpoint
+from Inversion import Inverter
+from InverseEncoder import InverseEncoder
 
 
 def convTBNReLU(in_channels, out_channels, kernel_size=4, stride=2, padding=1):
@@ -43,25 +47,33 @@ class Generator(nn.Module):
         out = self.block4(out)
         return torch.tanh(self.block5(out))
 
+parser = argparse.ArgumentParser(description='RecLoss')
+parser.add_argument('--restarts', default=8, type=int)
+parser.add_argument('--steps', default=2000, type=int)
+parser.add_argument('--patience', default=100, type=int)
+parser.add_argument('--seed', default=0, type=int)
+parser.add_argument('--encoder', default='', type=str, help='InverseEncoder weights to start the restarts from')
+args = parser.parse_args()
+
 latentdim = 20
 G = Generator(in_channels=latentdim, out_channels=1).cuda()
 genpareto_params = (1.33, 0, 0.0075761900937239765)
 threshold = -0.946046018600464
 rv = genpareto(*genpareto_params)
 
-G.load_state_dict(torch.load('DCGAN/G999.pt'))
+G.load_state_dict(torch.load(generator_checkpoint('DCGAN')))
 G.eval()
 num = 57
 G.requires_grad = False
 real = torch.load('data/test.pt').cuda()[:num]
-z = torch.zeros((num, latentdim, 1, 1)).cuda()
-z.requires_grad = True
-optimizer = torch.optim.Adam([z], lr=1e-2)
-criterion = nn.MSELoss()
-for i in range(2000):
-    pred = G(z)
-    loss = criterion(pred, real)
-    optimizer.zero_grad()
-    loss.backward()
-    optimizer.step()
-    print(loss)
+inverter = Inverter(G, latentdim, restarts=args.restarts, steps=args.steps, patience=args.patience)
+init = None
+if args.encoder:
+    E = InverseEncoder(latentdim, False).cuda()
+    E.load_state_dict(torch.load(args.encoder))
+    with torch.no_grad():
+        init = E.eval()(real)[0]
+z, loss, stats = inverter.invert(real, None, init=init, seed=args.seed)
+for i in range(num):
+    print('image', i, 'loss', loss[i].item(), 'restart', stats['restart'][i].item(), 'steps', stats['steps'][i].item())
+print('mean loss', loss.mean().item(), 'seconds per image', stats['seconds_per_image'])
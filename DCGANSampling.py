@@ -9,6 +9,19 @@ from scipy.stats import genpareto
 import torch.nn.functional as F
 from torch.autograd import Variable
 from torch import FloatTensor
+from EMA import generator_checkpoint
+from RejectionSampler import RejectionSampler
+from LatentBank import LatentBank
+from TailSampler import benchmark
+
+import argparse
+parser = argparse.ArgumentParser(description='DCGANSampling')
+parser.add_argument('--bank', default='', type=str,
+                    help='latent bank directory, built on first use and rebuilt when G changes')
+parser.add_argument('--bank_size', default=2000000, type=int)
+parser.add_argument('--benchmark_tail', action='store_true', default=False,
+                    help='compare MALA and rejection sampling at tau = 0.05, 0.01, 0.001')
+args = parser.parse_args()
 
 
 def convTBNReLU(in_channels, out_channels, kernel_size=4, stride=2, padding=1):
@@ -49,24 +62,32 @@ genpareto_params = (1.33, 0, 0.0075761900937239765)
 threshold = -0.946046018600464
 rv = genpareto(*genpareto_params)
 
-G.load_state_dict(torch.load('DCGAN/G999.pt'))
+checkpoint = generator_checkpoint('DCGAN')
+G.load_state_dict(torch.load(checkpoint))
 G.eval()
 
 c = 0.75
 k = 10
+if args.benchmark_tail:
+    benchmark(G, latentdim, {tau: rv.ppf(1 - tau / (c**k)) + threshold for tau in [0.05, 0.01, 0.001]})
+sampler = RejectionSampler(G, latentdim, memory_mb=2048)
+bank = None
+if args.bank:
+    bank = LatentBank.open(args.bank, G, latentdim, args.bank_size, checkpoint)
 for tau in [0.05, 0.01]:
     tau_prime = tau / (c**k)
     val = rv.ppf(1-tau_prime) + threshold
-    images = []
-    count = 0
-    t = time.time()
-    while count<100:
-        latent = Variable(FloatTensor(torch.randn((100, latentdim, 1, 1)))).cuda()
-        image = G(latent)
-        sums = image.sum(dim=(1, 2, 3))/4096 >= val
-        if sums.nonzero().shape[0] > 0:
-            images.append(image[sums])
-            count += sums.nonzero().shape[0]
-    print(time.time() - t)
-    images = torch.cat(images, 0)[:100]
+    if bank is not None and bank.count(val) >= 100:
+        t = time.time()
+        images = bank.sample(G, val, 100)
+        print(time.time() - t)
+        torch.save(images, 'DCGAN'+str(tau)+'.pt')
+        continue
+    # P(sum/4096 >= val) = c**k * tau_prime = tau under the fitted tail
+    images, stats = sampler.sample(val, 100, prior_rate=tau)
+    print(stats['time'])
+    if not stats['complete']:
+        print('tau {} gave up after {} draws with {} samples'.format(tau, stats['drawn'], stats['accepted']))
+    print('tau {} samples/sec {:.2f} passes/sample {:.4f} acceptance {:.5f}'.format(
+        tau, stats['samples_per_sec'], stats['passes_per_sample'], stats['acceptance_rate']))
     torch.save(images, 'DCGAN'+str(tau)+'.pt')
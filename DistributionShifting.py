@@ -14,34 +14,37 @@ import torchvision.utils as vutils
 from torch.autograd import Variable
 from torch import LongTensor, FloatTensor
 from torchvision.utils import save_image
+import shutil
 import sys
+from StreamingTopK import save_topk
+from MixedDataset import MixedDataset
+from StageCache import StageCache, file_digest, stage_key
+from EMA import EMA
 
 gpu_id = 0
 
 
-class NWSDataset(Dataset):
+class NWSDataset(MixedDataset):
     """
     NWS Dataset
     """
 
     def __init__(
-            self, fake='data/fake.pt', c=0.75, i=1, n=2557
+            self, real=None, fake='data/fake.pt', c=0.75, i=1, n=2557, fsize=None
     ):
         val = int(n * (c ** i))
-        self.real = torch.load('data/real.pt').cuda(gpu_id)
-        self.real.requires_grad = False
-        self.fake = torch.load(fake).cuda(gpu_id)
-        self.fake.requires_grad = False
+        if real is None:
+            real = torch.load('data/real.pt').cuda(gpu_id)
+        real.requires_grad = False
+        fake = torch.load(fake).cuda(gpu_id)
+        fake.requires_grad = False
         print('val', val)
-        print('len of self.real', len(self.real))
-        print('len of self.fake', len(self.fake))
-        self.realdata = torch.cat([self.real[:val], self.fake[:-1 * val]], 0)
-
-    def __len__(self):
-        return self.realdata.shape[0]
-
-    def __getitem__(self, item):
-        return self.realdata[item]
+        print('len of self.real', len(real))
+        print('len of self.fake', len(fake))
+        # fake files only hold the top samples of the previous stage, so count from its fsize
+        if fsize is None:
+            fsize = len(fake)
+        super(NWSDataset, self).__init__(real, fake, val, fsize - val)
 
 
 def weights_init_normal(m):
@@ -127,8 +130,9 @@ D = Discriminator(in_channels=1).cuda(gpu_id)
 G.apply(weights_init_normal)
 D.apply(weights_init_normal)
 
-optimizerG = optim.Adam(G.parameters(), lr=0.00002, betas=(0.5, 0.999))
-optimizerD = optim.Adam(D.parameters(), lr=0.00001, betas=(0.5, 0.999))
+lrG, lrD = 0.00002, 0.00001
+optimizerG = optim.Adam(G.parameters(), lr=lrG, betas=(0.5, 0.999))
+optimizerD = optim.Adam(D.parameters(), lr=lrD, betas=(0.5, 0.999))
 static_z = Variable(FloatTensor(torch.randn((81, latentdim, 1, 1)))).cuda(gpu_id)
 
 
@@ -140,26 +144,55 @@ def sample_image(stage, epoch):
 
 c = 0.75
 k = 10
+epochs = 100
+batch_size = 256
+chunk_size = 512
+ema_decay = 0.999
 DIRNAME = 'DistShift/'
 os.makedirs(DIRNAME, exist_ok=True)
 board = SummaryWriter(log_dir=DIRNAME)
+cache = StageCache(DIRNAME + 'stages/')
 
 G.load_state_dict(torch.load('DCGAN/G999.pt'))
 D.load_state_dict(torch.load('DCGAN/D999.pt'))
+G_ema = EMA(G, ema_decay)
+modules = {'G': G, 'D': D, 'optimizerG': optimizerG, 'optimizerD': optimizerD, 'G_ema': G_ema}
 step = 0
 fake_name = 'data/fake.pt'
+fsize = None
 n = 2557
+real = torch.load('data/real.pt').cuda(gpu_id)
+key = stage_key('', {f: file_digest(f) for f in ['DCGAN/G999.pt', 'DCGAN/D999.pt', 'data/real.pt', fake_name]})
+resume = None
 for i in range(1, k):
-    dataloader = DataLoader(NWSDataset(fake=fake_name, c=c, i=i, n=n), batch_size=256, shuffle=True)
-    for epoch in range(0, 100):
+    next_fsize = int((1 - (c ** (i + 1))) * n / c)
+    # the next stage reads the top fsize - val fakes and ExGAN reads n - val, keep
+    # enough for both so that a stage does not depend on k
+    keep = min(next_fsize, max(next_fsize, n) - int(n * (c ** (i + 1))))
+    key = stage_key(key, {'i': i, 'c': c, 'n': n, 'epochs': epochs, 'batch_size': batch_size,
+                          'lrG': lrG, 'lrD': lrD, 'chunk_size': chunk_size, 'keep': keep,
+                          'ema_decay': ema_decay})
+    if cache.done(key):
+        print('stage', i, 'cached in', cache.path(key))
+        meta = cache.meta(key)
+        fake_name, fsize, step, resume = cache.path(key, 'fake.pt'), meta['fsize'], meta['step'], key
+        shutil.copyfile(fake_name, DIRNAME + 'fake' + str(i + 1) + '.pt')
+        continue
+    if resume is not None:
+        print('resuming from', cache.path(resume))
+        cache.load(resume, modules)
+        resume = None
+    dataloader = DataLoader(NWSDataset(real=real, fake=fake_name, c=c, i=i, n=n, fsize=fsize),
+                            batch_size=batch_size, shuffle=True)
+    for epoch in range(0, epochs):
         print(epoch)
         for realdata in dataloader:
-            noise = 1e-5 * max(1 - (epoch / 100.0), 0)
+            noise = 1e-5 * max(1 - (epoch / float(epochs)), 0)
             step += 1
-            batch_size = realdata[0].shape[0]
-            trueTensor = 0.7 + 0.5 * torch.rand(batch_size)
-            falseTensor = 0.3 * torch.rand(batch_size)
-            probFlip = torch.rand(batch_size) < 0.05
+            bsz = realdata[0].shape[0]
+            trueTensor = 0.7 + 0.5 * torch.rand(bsz)
+            falseTensor = 0.3 * torch.rand(bsz)
+            probFlip = torch.rand(bsz) < 0.05
             probFlip = probFlip.float()
             trueTensor, falseTensor = (
                 probFlip * falseTensor + (1 - probFlip) * trueTensor,
@@ -170,7 +203,7 @@ for i in range(1, k):
             realdata = realdata.cuda(gpu_id)
             realSource = D(realdata)
             realLoss = criterionSource(realSource, trueTensor.expand_as(realSource))
-            latent = Variable(torch.randn(batch_size, latentdim, 1, 1)).cuda(gpu_id)
+            latent = Variable(torch.randn(bsz, latentdim, 1, 1)).cuda(gpu_id)
             fakeGen = G(latent)
             fakeGenSource = D(fakeGen.detach())
             fakeGenLoss = criterionSource(fakeGenSource, falseTensor.expand_as(fakeGenSource))
@@ -185,24 +218,26 @@ for i in range(1, k):
             lossG.backward()
             torch.nn.utils.clip_grad_norm_(G.parameters(), 20)
             optimizerG.step()
+            G_ema.update()
             board.add_scalar('realLoss', realLoss.item(), step)
             board.add_scalar('fakeGenLoss', fakeGenLoss.item(), step)
             board.add_scalar('lossD', lossD.item(), step)
             board.add_scalar('lossG', lossG.item(), step)
         if (epoch + 1) % 50 == 0:
             torch.save(G.state_dict(), DIRNAME + "Gstage" + str(i) + 'epoch' + str(epoch) + ".pt")
+            torch.save(G_ema.state_dict(), DIRNAME + "G_emastage" + str(i) + 'epoch' + str(epoch) + ".pt")
             torch.save(D.state_dict(), DIRNAME + "Dstage" + str(i) + 'epoch' + str(epoch) + ".pt")
         if (epoch + 1) % 10 == 0:
             with torch.no_grad():
                 G.eval()
                 sample_image(i, epoch)
                 G.train()
-    with torch.no_grad():
-        G.eval()
-        fsize = int((1 - (c ** (i + 1))) * n / c)
-        fakeSamples = G(Variable(torch.randn(fsize, latentdim, 1, 1)).cuda(gpu_id))
-        sums = fakeSamples.sum(dim=(1, 2, 3)).detach().cpu().numpy().argsort()[::-1].copy()
-        fake_name = DIRNAME + 'fake' + str(i + 1) + '.pt'
-        torch.save(fakeSamples.data[sums], fake_name)
-        del fakeSamples
-        G.train()
+    G.eval()
+    fsize = next_fsize
+    fake_name = cache.path(key, 'fake.pt')
+    os.makedirs(cache.path(key), exist_ok=True)
+    save_topk(fake_name, G, fsize, keep, latentdim, chunk_size=chunk_size, device='cuda:%d' % gpu_id,
+              score_path=cache.path(key, 'scores.pt'))
+    G.train()
+    cache.save(key, modules, {'stage': i, 'fsize': fsize, 'keep': keep, 'step': step})
+    shutil.copyfile(fake_name, DIRNAME + 'fake' + str(i + 1) + '.pt')
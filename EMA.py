@@ -0,0 +1,46 @@
+import copy
+import os
+import torch
+
+
+class EMA:
+    """
+    Exponential moving average of a module's weights.
+    The average lives in `self.module`, a frozen copy of the tracked module,
+    whose state_dict loads straight into a plain Generator.
+    """
+
+    def __init__(self, model, decay=0.999):
+        self.model = model
+        self.decay = decay
+        self.module = copy.deepcopy(model).eval()
+        for p in self.module.parameters():
+            p.requires_grad = False
+        self.ema_params = list(self.module.parameters())
+        self.model_params = list(model.parameters())
+
+    def update(self):
+        with torch.no_grad():
+            if hasattr(torch, '_foreach_lerp_'):
+                torch._foreach_lerp_(self.ema_params, self.model_params, 1 - self.decay)
+            else:
+                torch._foreach_mul_(self.ema_params, self.decay)
+                torch._foreach_add_(self.ema_params, self.model_params, alpha=1 - self.decay)
+            for b_ema, b in zip(self.module.buffers(), self.model.buffers()):
+                b_ema.copy_(b)
+
+    def state_dict(self):
+        return self.module.state_dict()
+
+    def load_state_dict(self, state_dict):
+        self.module.load_state_dict(state_dict)
+
+
+def generator_checkpoint(dirname, epoch=999, name='G'):
+    """
+    Path of the generator checkpoint to sample from, preferring the EMA weights.
+    """
+    ema_path = os.path.join(dirname, '{}_ema{}.pt'.format(name, epoch))
+    if os.path.isfile(ema_path):
+        return ema_path
+    return os.path.join(dirname, '{}{}.pt'.format(name, epoch))
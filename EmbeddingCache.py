@@ -0,0 +1,76 @@
+import hashlib
+import json
+import os
+import numpy as np
+import torch
+from SampleStore import data_digest, fields
+
+
+def encoder_hash(model):
+    """
+    Hash of an encoder's class and weights, any retraining changes it.
+    """
+    h = hashlib.sha1(type(model).__name__.encode())
+    for name, tensor in sorted(model.state_dict().items()):
+        h.update(name.encode())
+        h.update(tensor.detach().cpu().contiguous().numpy().tobytes())
+    return h.hexdigest()[:16]
+
+
+def count(path):
+    if os.path.isdir(path):
+        with open(os.path.join(path, 'meta.json')) as f:
+            return json.load(f)['total']
+    return len(torch.load(path, map_location='cpu'))
+
+
+class EmbeddingCache:
+    """
+    Embeddings of a whole dataset under one encoder, encoded once in chunks
+    straight into a memory-mapped .npy. Every (name, data) pair has one
+    folder whose meta.json records the encoder hash; a different encoder
+    re-encodes it in place. meta.json is written last and marks it complete.
+    """
+
+    def __init__(self, root='embedding_cache/'):
+        self.root = root
+
+    def folder(self, path, name):
+        return os.path.join(self.root, '{}_{}'.format(name, data_digest(path)[:16]))
+
+    def get(self, model, path, name='conv', flatten=False, batch_size=4096, device='cuda', unit=False):
+        """
+        Read-only memmap of shape (len(data), dim) of model over the fields at
+        path, a tensor file or a SampleStore folder; unit as in fields().
+        """
+        folder = self.folder(path, name + ('_unit' if unit and not os.path.isdir(path) else ''))
+        key = encoder_hash(model)
+        meta_path = os.path.join(folder, 'meta.json')
+        if os.path.isfile(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta['encoder'] == key:
+                return np.load(os.path.join(folder, 'embeddings.npy'), mmap_mode='r')
+            os.remove(meta_path)
+        os.makedirs(folder, exist_ok=True)
+
+        model = model.to(device)
+        training = model.training
+        model.eval()
+        n, out, done = count(path), None, 0
+        with torch.no_grad():
+            for batch in fields(path, batch_size, unit):
+                x = torch.as_tensor(batch, dtype=torch.float32).to(device)
+                z = model(x.reshape(len(x), -1) if flatten else x).reshape(len(x), -1).cpu().numpy()
+                if out is None:
+                    out = np.lib.format.open_memmap(os.path.join(folder, 'embeddings.npy'), mode='w+',
+                                                    dtype=np.float32, shape=(n, z.shape[1]))
+                out[done:done + len(z)] = z
+                done += len(z)
+        out.flush()
+        model.train(training)
+        with open(meta_path, 'w') as f:
+            json.dump({'encoder': key, 'data': data_digest(path), 'name': name, 'count': n,
+                       'dim': int(out.shape[1])}, f)
+        del out
+        return np.load(os.path.join(folder, 'embeddings.npy'), mmap_mode='r')
@@ -0,0 +1,157 @@
+import argparse
+import csv
+import json
+import os
+import re
+import time
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+from scipy.stats import genpareto
+import FID
+import RNGStreams
+from ConditionalSampling import tau_to_val
+from Extremeness import AvgExtremeness
+from Frechet import FrechetReference
+from Inversion import Inverter
+from Models import load_generator, load_pggan
+from RunningStats import RunningStats
+
+genpareto_params = (1.33, 0, 0.0075761900937239765)
+threshold = -0.946046018600464
+rv = genpareto(*genpareto_params)
+
+worker = {}
+
+
+def find_checkpoints(dirname):
+    """
+    (epoch, name, path) of every G<epoch>.pt and G_ema<epoch>.pt in a run directory.
+    """
+    found = []
+    for name in os.listdir(dirname):
+        match = re.match(r'^(G|G_ema)(\d+)\.pt$', name)
+        if match:
+            found.append((int(match.group(2)), name[:-3], os.path.join(dirname, name)))
+    return sorted(found)
+
+
+def init_worker(args, extractor_id, devices):
+    """
+    Every worker reads the extractor, reference statistics and test set from the shared cache once.
+    """
+    rank = mp.current_process()._identity[0] - 1 if mp.current_process()._identity else 0
+    device = devices[rank % len(devices)]
+    if device.startswith('cuda'):
+        torch.cuda.set_device(device)
+    worker['device'] = device
+    worker['args'] = args
+    worker['ae'], _ = FID.load_extractor(args.train, args.cache)
+    mean, cov, _ = FID.cached_statistics(worker['ae'], extractor_id, args.reference, args.cache)
+    worker['reference'] = FrechetReference(mean, cov)
+    worker['test'] = torch.load(args.test)[:args.rec_num]
+
+
+def generate(G, kind, index, val=None):
+    latent = RNGStreams.latents(0, index, 20).to(worker['device'])
+    with torch.no_grad():
+        if kind == 'pggan':
+            e_samples = RNGStreams.exponentials(0, index, [1] + list(G.sigma.shape)).to(worker['device'])
+            return 2 * G(latent, e_samples) - 1
+        if kind == 'exgan':
+            code = torch.full((len(index), 1, 1, 1), float(val), device=worker['device'])
+            return G(latent, code)
+        return G(latent)
+
+
+def reconstruction_loss(G, kind, real, args):
+    real = real.to(worker['device'])
+    code = (real.sum((1, 2, 3)) / 4096).view(-1, 1, 1, 1) if kind == 'exgan' else None
+    inverter = Inverter(G, 20, restarts=args.restarts, steps=args.rec_steps, device=worker['device'])
+    _, loss, stats = inverter.invert(real, code, seed=0)
+    return loss.mean().item(), stats['seconds_per_image']
+
+
+def evaluate(checkpoint):
+    epoch, name, path = checkpoint
+    args = worker['args']
+    if args.kind == 'pggan':
+        G = load_pggan(args.run, args.model, args.simple, epoch=epoch, device=worker['device'], checkpoint=path)
+    else:
+        G = load_generator(args.kind, args.run, device=worker['device'], checkpoint=path)
+    for p in G.parameters():
+        p.requires_grad = False
+    row = {'checkpoint': name, 'epoch': epoch}
+    criterion = AvgExtremeness()
+    vals = tau_to_val(args.taus, rv, threshold, args.c, args.k)
+
+    t = time.time()
+    stats = RunningStats(128)
+    scores = []
+    for i in range(0, args.n, args.batch_size):
+        index = np.arange(i, min(i + args.batch_size, args.n))
+        images = generate(G, args.kind, index, vals[-1] if args.kind == 'exgan' else None)
+        scores.append(criterion.cal_extreme(images).cpu())
+        FID.accumulate(worker['ae'], images, stats=stats)
+    row['sampling_ms_per_sample'] = (time.time() - t) / args.n * 1000
+    row['fid'] = worker['reference'].distance(stats.mean, stats.cov)
+
+    scores = torch.cat(scores, 0)
+    for tau, val in zip(args.taus, vals):
+        if args.kind == 'exgan':
+            images = generate(G, 'exgan', np.arange(args.n, args.n + args.batch_size), val)
+            row['rel_err_tau{}'.format(tau)] = float((torch.abs(criterion.cal_extreme(images) - val) / abs(val)).mean())
+        else:
+            # calibrated tail: the fraction above the tau level is tau
+            row['exceed_ratio_tau{}'.format(tau)] = float((scores >= val).float().mean()) / tau
+
+    if args.kind != 'pggan' and args.rec_steps > 0:
+        row['rec_loss'], seconds = reconstruction_loss(G, args.kind, worker['test'], args)
+        row['rec_ms_per_image'] = seconds * 1000
+    print(row)
+    return row
+
+
+def write_report(rows, dirname):
+    with open(os.path.join(dirname, 'report.json'), 'w') as f:
+        json.dump(rows, f, indent=2)
+    fields = []
+    for row in rows:
+        fields += [key for key in row if key not in fields]
+    with open(os.path.join(dirname, 'report.csv'), 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Evaluate')
+    parser.add_argument('--run', default='DCGAN', type=str, help='run directory holding G<epoch>.pt checkpoints')
+    parser.add_argument('--kind', default='dcgan', choices=['dcgan', 'exgan', 'pggan'])
+    parser.add_argument('--model', default='finetune', type=str)
+    parser.add_argument('--simple', action='store_true', default=False)
+    parser.add_argument('--train', default='../data/test.pt', type=str, help='FID extractor training data')
+    parser.add_argument('--reference', default='/mnt/home/junli/PGGAN/data/fake10.pt', type=str)
+    parser.add_argument('--test', default='data/test.pt', type=str, help='reconstruction targets')
+    parser.add_argument('--cache', default='fid_cache/', type=str)
+    parser.add_argument('--n', default=2048, type=int, help='samples per checkpoint')
+    parser.add_argument('--batch_size', default=512, type=int)
+    parser.add_argument('--taus', nargs='*', type=float, default=[0.05, 0.01])
+    parser.add_argument('--c', default=0.75, type=float)
+    parser.add_argument('--k', default=10, type=int)
+    parser.add_argument('--rec_num', default=57, type=int)
+    parser.add_argument('--rec_steps', default=2000, type=int, help='0 skips the reconstruction loss')
+    parser.add_argument('--restarts', default=8, type=int)
+    parser.add_argument('--workers', default=max(torch.cuda.device_count(), 1), type=int)
+    args = parser.parse_args()
+
+    # fill the shared cache once so the workers only read it
+    ae, extractor_id = FID.load_extractor(args.train, args.cache)
+    FID.cached_statistics(ae, extractor_id, args.reference, args.cache)
+    del ae
+    devices = ['cuda:{}'.format(i) for i in range(torch.cuda.device_count())] or ['cpu']
+    checkpoints = find_checkpoints(args.run)
+    with mp.get_context('spawn').Pool(args.workers, initializer=init_worker,
+                                      initargs=(args, extractor_id, devices)) as pool:
+        rows = pool.map(evaluate, checkpoints, chunksize=1)
+    write_report(rows, args.run)
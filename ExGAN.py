@@ -13,37 +13,40 @@ from torch import LongTensor, FloatTensor
 from scipy.stats import skewnorm, genpareto
 from torchvision.utils import save_image
 import sys
+from EMA import EMA
 import argparse
+from MixedDataset import MixedDataset
+from Extremeness import get_extremeness, load_labels
 
 parser = argparse.ArgumentParser()
 parser.add_argument("--c", type=float, default=0.75)
 parser.add_argument("--gpu_id", type=int, default=0)
 parser.add_argument('--k', type=int, default=10)
+parser.add_argument('--extremeness', type=str, default='avg')
+parser.add_argument('--ema_decay', type=float, default=0.999)
 opt = parser.parse_args()
 cudanum = opt.gpu_id
 
 
-class NWSDataset(Dataset):
+class NWSDataset(MixedDataset):
     """
     NWS Dataset
     """
 
     def __init__(
-            self, fake='DistShift/fake10.pt', c=0.75, k=10, n=2557
+            self, fake='DistShift/fake10.pt', c=0.75, k=10, n=2557, extremeness='avg'
     ):
         val = int((c ** k) * n)
-        self.real = torch.load('data/real.pt').cuda(cudanum)
-        self.fake = torch.load(fake).cuda(cudanum)
-        self.realdata = torch.cat([self.real[:val], self.fake[:n - val]], 0)
-        indices = torch.randperm(n)
-        self.realdata = self.realdata[indices]
-
-    def __len__(self):
-        return self.realdata.shape[0]
+        real = torch.load('data/real.pt').cuda(cudanum)
+        self.real_labels = load_labels('data/real.pt', real, extremeness)
+        fake_store = torch.load(fake).cuda(cudanum)
+        self.fake_labels = load_labels(fake, fake_store, extremeness)
+        super(NWSDataset, self).__init__(real, fake_store, val, n - val, shuffle=True)
 
     def __getitem__(self, item):
-        img = self.realdata[item]
-        return img, img.sum() / 4096
+        store, idx = self.index(item)
+        labels = self.real_labels if store is self.real else self.fake_labels
+        return store[idx], labels[idx]
 
 
 def weights_init_normal(m):
@@ -101,9 +104,10 @@ class Generator(nn.Module):
 
 
 class Discriminator(nn.Module):
-    def __init__(self, in_channels):
+    def __init__(self, in_channels, criterion):
         super(Discriminator, self).__init__()
         self.in_channels = in_channels
+        self.criterion = criterion
         self.block1 = convBNReLU(self.in_channels, 64)
         self.block2 = convBNReLU(64, 128)
         self.block3 = convBNReLU(128, 256)
@@ -111,8 +115,10 @@ class Discriminator(nn.Module):
         self.block5 = nn.Conv2d(512, 64, 4, 1, 0)
         self.source = nn.Linear(64 + 1, 1)
 
-    def forward(self, inp, extreme):
-        sums = inp.sum(dim=(1, 2, 3)) / 4096
+    def forward(self, inp, extreme, sums=None):
+        # real batches come with their precomputed labels
+        if sums is None:
+            sums = self.criterion.cal_extreme(inp)
         diff = torch.abs(extreme.view(-1, 1) - sums.view(-1, 1)) / torch.abs(extreme.view(-1, 1))
         out = self.block1(inp)
         out = self.block2(out)
@@ -127,8 +133,9 @@ class Discriminator(nn.Module):
 
 latentdim = 20
 criterionSource = nn.BCELoss()
+criterionExtreme = get_extremeness(opt.extremeness)
 G = Generator(in_channels=latentdim, out_channels=1).cuda(cudanum)
-D = Discriminator(in_channels=1).cuda(cudanum)
+D = Discriminator(in_channels=1, criterion=criterionExtreme).cuda(cudanum)
 G.apply(weights_init_normal)
 D.apply(weights_init_normal)
 genpareto_params = (1.33, 0, 0.0075761900937239765)
@@ -149,6 +156,7 @@ def sample_cont_code(batch_size):
 
 
 optimizerG = optim.Adam(G.parameters(), lr=0.0002, betas=(0.5, 0.999))
+G_ema = EMA(G, opt.ema_decay)
 optimizerD = optim.Adam(D.parameters(), lr=0.0001, betas=(0.5, 0.999))
 static_code = sample_cont_code(81)
 
@@ -166,7 +174,7 @@ board = SummaryWriter(log_dir=DIRNAME)
 step = 0
 n = 2557
 fakename = 'DistShift/fake10.pt'
-dataloader = DataLoader(NWSDataset(fake=fakename, c=c, k=k, n=n), batch_size=256, shuffle=True)
+dataloader = DataLoader(NWSDataset(fake=fakename, c=c, k=k, n=n, extremeness=opt.extremeness), batch_size=256, shuffle=True)
 for epoch in range(0, 1000):
     print(epoch)
     for images, labels in dataloader:
@@ -186,7 +194,7 @@ for epoch in range(0, 1000):
         images, labels = images.cuda(cudanum), labels.view(-1, 1).cuda(cudanum)
         print('images', images.size())
         print('labels', labels.size())
-        realSource = D(images, labels)
+        realSource = D(images, labels, labels)
         print('realSource', realSource.size())
         realLoss = criterionSource(realSource, trueTensor.expand_as(realSource))
         latent = Variable(torch.randn(batch_size, latentdim, 1, 1)).cuda(cudanum)
@@ -200,13 +208,14 @@ for epoch in range(0, 1000):
         torch.nn.utils.clip_grad_norm_(D.parameters(), 20)
         optimizerD.step()
         fakeGenSource = D(fakeGen, code)
-        fakeLabels = fakeGen.sum(dim=(1, 2, 3)) / 4096
+        fakeLabels = criterionExtreme.cal_extreme(fakeGen)
         rpd = torch.mean(torch.abs((fakeLabels - code.view(batch_size)) / code.view(batch_size)))
         lossG = criterionSource(fakeGenSource, trueTensor.expand_as(fakeGenSource)) + rpd
         optimizerG.zero_grad()
         lossG.backward()
         torch.nn.utils.clip_grad_norm_(G.parameters(), 20)
         optimizerG.step()
+        G_ema.update()
         board.add_scalar('realLoss', realLoss.item(), step)
         board.add_scalar('fakeGenLoss', fakeGenLoss.item(), step)
         board.add_scalar('fakeContLoss', rpd.item(), step)
@@ -214,6 +223,7 @@ for epoch in range(0, 1000):
         board.add_scalar('lossG', lossG.item(), step)
     if (epoch + 1) % 50 == 0:
         torch.save(G.state_dict(), DIRNAME + 'G' + str(epoch) + ".pt")
+        torch.save(G_ema.state_dict(), DIRNAME + 'G_ema' + str(epoch) + ".pt")
         torch.save(D.state_dict(), DIRNAME + 'D' + str(epoch) + ".pt")
     if (epoch + 1) % 10 == 0:
         with torch.no_grad():
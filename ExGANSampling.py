@@ -9,6 +9,8 @@ from scipy.stats import genpareto
 import torch.nn.functional as F
 from torch.autograd import Variable
 from torch import FloatTensor
+from EMA import generator_checkpoint
+from ConditionalSampling import sample_taus
 
 def convTBNReLU(in_channels, out_channels, kernel_size=4, stride=2, padding=1):
     return nn.Sequential(
@@ -44,22 +46,19 @@ class Generator(nn.Module):
         return torch.tanh(self.block5(out))
 
 latentdim = 20
-G = Generator(in_channels=latentdim, out_channels=1).cuda()
+device = 'cuda'
+G = Generator(in_channels=latentdim, out_channels=1).to(device)
 genpareto_params = (1.33, 0, 0.0075761900937239765)
 threshold = -0.946046018600464
 rv = genpareto(*genpareto_params)
 
-G.load_state_dict(torch.load('ExGAN/G999.pt'))
+G.load_state_dict(torch.load(generator_checkpoint('ExGAN'), map_location=device))
 G.eval()
 
 c = 0.75
 k = 10
-for tau in [0.05, 0.01]:
-    tau_prime = tau / (c**k)
-    val = rv.ppf(1-tau_prime) + threshold
-    t = time.time()
-    code = Variable(torch.ones(100, 1, 1, 1)*val).cuda(2)
-    latent = Variable(FloatTensor(torch.randn((100, latentdim, 1, 1)))).cuda(2)
-    images = G(latent, code)
-    print(time.time() - t)
-    torch.save(0.5*(images+1), 'ExGAN'+str(tau)+'.pt')
\ No newline at end of file
+t = time.time()
+samples = sample_taus(G, latentdim, [0.05, 0.01], 100, rv, threshold, c, k, device=device)
+print(time.time() - t)
+for tau, images in samples.items():
+    torch.save(0.5*(images+1), 'ExGAN'+str(tau)+'.pt')
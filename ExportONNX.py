@@ -0,0 +1,51 @@
+import argparse
+import numpy as np
+import torch
+import RNGStreams
+from Models import load_pggan
+
+
+def export(sampler, path, latentdim=20, opset=13):
+    """
+    Exports a Models.PGGANSampler as one ONNX graph. sigma and gamma
+    become initializers; latent and e_samples are inputs with a dynamic batch.
+    """
+    sampler = sampler.cpu().eval()
+    latent = RNGStreams.latents(0, np.arange(2), latentdim)
+    e_samples = RNGStreams.exponentials(0, np.arange(2), [1] + list(sampler.sigma.shape))
+    torch.onnx.export(sampler, (latent, e_samples), path, opset_version=opset,
+                      input_names=['latent', 'e_samples'], output_names=['samples'],
+                      dynamic_axes={'latent': {0: 'batch'}, 'e_samples': {0: 'batch'}, 'samples': {0: 'batch'}})
+
+
+def check_parity(sampler, path, latentdim=20, n=64, seed=0, atol=1e-4):
+    """
+    Runs the same seeded noise through torch and onnxruntime and checks the outputs agree.
+    """
+    from ONNXSampling import ONNXSampler
+    onnx_samples = ONNXSampler(path).sample(n, seed)
+    index = np.arange(n)
+    with torch.no_grad():
+        torch_samples = sampler.cpu().eval()(
+            RNGStreams.latents(seed, index, latentdim),
+            RNGStreams.exponentials(seed, index, [1] + list(sampler.sigma.shape))).numpy()
+    err = float(np.abs(torch_samples - onnx_samples).max())
+    print('max abs difference torch vs onnxruntime', err)
+    if not np.isfinite(err) or err > atol:
+        raise AssertionError('onnx export differs from torch by {} > {}'.format(err, atol))
+    return err
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='ExportONNX')
+    parser.add_argument('--save', default='', type=str, help='run directory holding the checkpoints')
+    parser.add_argument('--model', default='finetune', type=str)
+    parser.add_argument('--simple', action='store_true', default=False)
+    parser.add_argument('--out', default='', type=str, help='defaults to <save>/pggan.onnx')
+    parser.add_argument('--opset', default=13, type=int)
+    args = parser.parse_args()
+
+    sampler = load_pggan(args.save, args.model, args.simple, device='cpu')
+    out = args.out or '{}/pggan.onnx'.format(args.save)
+    export(sampler, out, opset=args.opset)
+    check_parity(sampler, out)
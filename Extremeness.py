@@ -92,3 +92,40 @@ class MaxExtremeness(Extremeness):
         return batch_level
    
 
+
+
+EXTREMENESS = {
+    'avg': AvgExtremeness,
+    'max': MaxExtremeness,
+}
+
+
+def register_extremeness(name, cls):
+    EXTREMENESS[name] = cls
+
+
+def get_extremeness(name):
+    if name not in EXTREMENESS:
+        raise KeyError('unknown extremeness criterion {}, registered: {}'.format(name, sorted(EXTREMENESS)))
+    return EXTREMENESS[name]()
+
+
+def compute_labels(store, criterion, chunk_size=1024):
+    with torch.no_grad():
+        return torch.cat([criterion.cal_extreme(store[i:i + chunk_size])
+                          for i in range(0, len(store), chunk_size)], 0)
+
+
+def load_labels(path, store, name='avg'):
+    """
+    Extremeness labels of every sample in the tensor saved at `path`, cached
+    next to it as <path>.<name>.pt and recomputed when the data file is newer.
+    """
+    label_path = '{}.{}.pt'.format(os.path.splitext(path)[0], name)
+    if os.path.isfile(label_path) and os.path.getmtime(label_path) >= os.path.getmtime(path):
+        labels = torch.load(label_path)
+        if len(labels) == len(store):
+            return labels.to(store.device)
+    labels = compute_labels(store, get_extremeness(name))
+    torch.save(labels.cpu(), label_path)
+    return labels
@@ -6,13 +6,19 @@ import numpy as np
 import matplotlib.pyplot as plt
 from skimage.transform import resize
 from torchvision import transforms
-from scipy import linalg
-import warnings
+import argparse
+import hashlib
+import os
+from StageCache import file_digest
+from RunningStats import RunningStats
+from Frechet import FrechetReference, frechet_distance
+from SampleStore import data_digest, fields
+from EmbeddingCache import EmbeddingCache
 
-
-data = torch.load('../data/test.pt')
 numSamples = 57
 EPOCHS = 50
+# bump when the AutoEncoder or its training changes, invalidates every cached artifact
+EXTRACTOR_VERSION = 1
 loss_func = nn.L1Loss()
 
 class AutoEncoder(nn.Module):
@@ -26,25 +32,45 @@ class AutoEncoder(nn.Module):
         x = self.decoder(x)
         return x
 
-ae = AutoEncoder().cuda()
-optimizer = torch.optim.Adam(ae.parameters(), lr=1e-3)
-data = data.reshape(data.shape[0], -1)[:numSamples]
-losses = []
 
-for epoch in range(EPOCHS):
-    x = torch.autograd.Variable(data[torch.randperm(numSamples)]).cuda()
-    optimizer.zero_grad()
-    pred = ae(x)
-    loss = loss_func(pred, x)
-    losses.append(loss.cpu().data.item())
-    loss.backward()
-    optimizer.step()
-plt.plot(losses)
+def train_extractor(data, seed=0):
+    torch.manual_seed(seed)
+    ae = AutoEncoder().cuda()
+    optimizer = torch.optim.Adam(ae.parameters(), lr=1e-3)
+    data = data.reshape(data.shape[0], -1)[:numSamples]
+    losses = []
+
+    for epoch in range(EPOCHS):
+        x = torch.autograd.Variable(data[torch.randperm(numSamples)]).cuda()
+        optimizer.zero_grad()
+        pred = ae(x)
+        loss = loss_func(pred, x)
+        losses.append(loss.cpu().data.item())
+        loss.backward()
+        optimizer.step()
+    plt.plot(losses)
+    return ae.eval()
+
+
+def load_extractor(train_path, cache_dir='fid_cache/'):
+    """
+    AutoEncoder trained on train_path, reused from cache_dir while the training
+    data and EXTRACTOR_VERSION are unchanged. Returns the model and its id.
+    """
+    extractor_id = hashlib.sha1('{}:{}:{}:{}'.format(
+        EXTRACTOR_VERSION, file_digest(train_path), numSamples, EPOCHS).encode()).hexdigest()[:16]
+    path = os.path.join(cache_dir, 'extractor_{}.pt'.format(extractor_id))
+    if os.path.isfile(path):
+        ae = AutoEncoder().cuda()
+        ae.load_state_dict(torch.load(path))
+        return ae.eval(), extractor_id
+    ae = train_extractor(torch.load(train_path))
+    os.makedirs(cache_dir, exist_ok=True)
+    torch.save(ae.state_dict(), path)
+    return ae, extractor_id
 
-ae.eval()
 
 def FID(mu1, mu2, sigma1, sigma2):
-    eps=1e-30
     mu1 = np.atleast_1d(mu1)
     mu2 = np.atleast_1d(mu2)
 
@@ -54,35 +80,89 @@ def FID(mu1, mu2, sigma1, sigma2):
     assert mu1.shape == mu2.shape, "Training and test mean vectors have different lengths"
     assert sigma1.shape == sigma2.shape, "Training and test covariances have different dimensions"
 
-    diff = mu1 - mu2
-    # product might be almost singular
-    covmean, _ = linalg.sqrtm(sigma1.dot(sigma2), disp=False)
-    if not np.isfinite(covmean).all():
-        msg = "fid calculation produces singular product; adding %s to diagonal of cov estimates" % eps
-        warnings.warn(msg)
-        offset = np.eye(sigma1.shape[0]) * eps
-        covmean = linalg.sqrtm((sigma1 + offset).dot(sigma2 + offset))
-
-    # numerical error might give slight imaginary component
-    if np.iscomplexobj(covmean):
-        if not np.allclose(np.diagonal(covmean).imag, 0, atol=1e-3):
-            m = np.max(np.abs(covmean.imag))
-            raise ValueError("Imaginary component {}".format(m))
-        covmean = covmean.real
-
-    tr_covmean = np.trace(covmean)
-    return diff.dot(diff) + np.trace(sigma1) + np.trace(sigma2) - 2 * tr_covmean
-
-def calcFID(data):
-    data = data.reshape(data.shape[0], -1)
-    features = ae.encoder(data.cuda()).detach().cpu().numpy()
-    mean, covar = np.mean(features, 0), np.cov(features, rowvar=False)
+    return frechet_distance(mu1, mu2, sigma1, sigma2)
+
+
+def batches(data, batch_size=4096):
+    """
+    Batches of a tensor, a saved tensor file or a SampleStore directory, read
+    through SampleStore.fields so stores are on the [-1, 1] scale as well.
+    """
+    if isinstance(data, str):
+        for batch in fields(data, batch_size):
+            yield torch.from_numpy(batch)
+        return
+    for i in range(0, len(data), batch_size):
+        yield data[i:i + batch_size]
+
+
+def accumulate(ae, data, batch_size=4096, stats=None):
+    """
+    Folds the features of data into a RunningStats, one batch on the GPU at a time.
+    """
+    stats = stats if stats is not None else RunningStats(128)
+    with torch.no_grad():
+        for batch in batches(data, batch_size):
+            batch = batch.reshape(batch.shape[0], -1)
+            stats.update(ae.encoder(batch.cuda()).detach().cpu().numpy())
+    return stats
+
+
+def statistics(ae, data, batch_size=4096):
+    stats = accumulate(ae, data, batch_size)
+    return stats.mean, stats.cov, stats.count
+
+
+def cached_statistics(ae, extractor_id, path, cache_dir='fid_cache/'):
+    """
+    Mean, covariance and sample count of the features of a tensor file or
+    SampleStore folder, cached per (data hash, extractor id).
+    """
+    key = hashlib.sha1('{}:{}'.format(data_digest(path), extractor_id).encode()).hexdigest()[:16]
+    stats_path = os.path.join(cache_dir, 'stats_{}.npz'.format(key))
+    if os.path.isfile(stats_path):
+        stats = np.load(stats_path)
+        return stats['mean'], stats['cov'], int(stats['count'])
+    # the per-sample features land in the shared cache that NearestNeighbors.py --features fid reads
+    features = EmbeddingCache().get(ae.encoder, path, 'fid', flatten=True)
+    stats = RunningStats(128)
+    for i in range(0, len(features), 65536):
+        stats.update(features[i:i + 65536])
+    mean, cov, count = stats.mean, stats.cov, stats.count
+    os.makedirs(cache_dir, exist_ok=True)
+    np.savez(stats_path, mean=mean, cov=cov, count=count)
+    return mean, cov, count
+
+
+def calcFID(ae, data, base_mean, base_covar):
+    mean, covar, _ = statistics(ae, data)
     return FID(mean, base_mean, covar, base_covar)
 
-base_data = torch.load('/mnt/home/junli/PGGAN/data/fake10.pt')
-#base_data = base_data.reshape(base_data.shape[0], -1)[:numSamples]
-base_data = base_data.reshape(base_data.shape[0], -1)
-base_features = ae.encoder(Variable(base_data).cuda()).detach().cpu().numpy()
-base_mean, base_covar = np.mean(base_features, 0), np.cov(base_features, rowvar=False)
-fid = calcFID(data)
-print('FID', fid)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='FID')
+    parser.add_argument('--train', default='../data/test.pt', type=str,
+                        help='data the feature extractor is trained on')
+    parser.add_argument('--reference', default='/mnt/home/junli/PGGAN/data/fake10.pt', type=str)
+    parser.add_argument('--samples', default='', type=str,
+                        help='samples to evaluate, a tensor file or a SampleStore folder, defaults to --train')
+    parser.add_argument('--cache', default='fid_cache/', type=str)
+    parser.add_argument('--partial', default='', type=str,
+                        help='only accumulate --samples and save the partial statistics to this .npz')
+    parser.add_argument('--merge', nargs='*', default=[],
+                        help='partial statistics from other workers to score instead of --samples')
+    args = parser.parse_args()
+
+    ae, extractor_id = load_extractor(args.train, args.cache)
+    if args.partial:
+        accumulate(ae, args.samples or args.train).save(args.partial)
+    else:
+        base_mean, base_covar, _ = cached_statistics(ae, extractor_id, args.reference, args.cache)
+        if args.merge:
+            stats = RunningStats.load(args.merge[0])
+            for path in args.merge[1:]:
+                stats.merge(RunningStats.load(path))
+            fid = FrechetReference(base_mean, base_covar).distance(stats.mean, stats.cov)
+        else:
+            fid = calcFID(ae, args.samples or args.train, base_mean, base_covar)
+        print('FID', fid)
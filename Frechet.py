@@ -0,0 +1,89 @@
+import argparse
+import time
+import numpy as np
+from scipy import linalg
+
+
+def sqrt_psd(sigma):
+    """
+    Symmetric square root of a covariance matrix, negative eigenvalues from
+    round-off are clipped to zero.
+    """
+    w, v = np.linalg.eigh(sigma)
+    return (v * np.sqrt(np.clip(w, 0, None))).dot(v.T)
+
+
+class FrechetReference:
+    """
+    Frechet distance to a fixed reference Gaussian (mu, sigma).
+    tr sqrt(S1 S2) equals the sum of the square roots of the eigenvalues of
+    the symmetric PSD matrix sqrt(S_ref) S sqrt(S_ref), so each candidate only
+    needs one eigvalsh and sqrt(S_ref) is computed once.
+    """
+
+    def __init__(self, mu, sigma):
+        self.mu = np.atleast_1d(np.asarray(mu, dtype=np.float64))
+        self.sigma = np.atleast_2d(np.asarray(sigma, dtype=np.float64))
+        self.sqrt_sigma = sqrt_psd(self.sigma)
+        self.trace = np.trace(self.sigma)
+
+    def distances(self, mus, sigmas):
+        """
+        Distances of k candidates at once, mus is (k, d) and sigmas (k, d, d).
+        """
+        mus = np.asarray(mus, dtype=np.float64).reshape(-1, len(self.mu))
+        sigmas = np.asarray(sigmas, dtype=np.float64).reshape(-1, len(self.mu), len(self.mu))
+        assert mus.shape[0] == sigmas.shape[0], "Different numbers of means and covariances"
+        inner = np.matmul(np.matmul(self.sqrt_sigma, sigmas), self.sqrt_sigma)
+        inner = 0.5 * (inner + np.swapaxes(inner, 1, 2))
+        tr_covmean = np.sqrt(np.clip(np.linalg.eigvalsh(inner), 0, None)).sum(1)
+        diff = mus - self.mu
+        return (diff * diff).sum(1) + self.trace + np.trace(sigmas, axis1=1, axis2=2) - 2 * tr_covmean
+
+    def distance(self, mu, sigma):
+        return float(self.distances(mu, sigma)[0])
+
+
+def frechet_distance(mu1, mu2, sigma1, sigma2):
+    return FrechetReference(mu2, sigma2).distance(mu1, sigma1)
+
+
+def sqrtm_distance(mu1, mu2, sigma1, sigma2):
+    diff = mu1 - mu2
+    covmean = linalg.sqrtm(sigma1.dot(sigma2), disp=False)[0].real
+    return diff.dot(diff) + np.trace(sigma1) + np.trace(sigma2) - 2 * np.trace(covmean)
+
+
+def random_cov(d, rng):
+    x = rng.standard_normal((4 * d, d))
+    return np.cov(x, rowvar=False)
+
+
+def benchmark(dims=(128, 256, 512), candidates=16, seed=0):
+    """
+    Time and agreement of sqrtm against the cached-eigh version for one reference and many candidates.
+    """
+    rng = np.random.default_rng(seed)
+    results = {}
+    for d in dims:
+        mu_ref, sigma_ref = rng.standard_normal(d), random_cov(d, rng)
+        mus = rng.standard_normal((candidates, d))
+        sigmas = np.stack([random_cov(d, rng) for _ in range(candidates)])
+        t = time.time()
+        slow = np.array([sqrtm_distance(mus[i], mu_ref, sigmas[i], sigma_ref) for i in range(candidates)])
+        t_sqrtm = time.time() - t
+        t = time.time()
+        fast = FrechetReference(mu_ref, sigma_ref).distances(mus, sigmas)
+        t_eigh = time.time() - t
+        results[d] = {'sqrtm_ms': t_sqrtm / candidates * 1000, 'eigh_ms': t_eigh / candidates * 1000,
+                      'speedup': t_sqrtm / t_eigh, 'max_rel_diff': float(np.max(np.abs(slow - fast) / np.abs(slow)))}
+        print('dim', d, results[d])
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Frechet')
+    parser.add_argument('--dims', nargs='*', type=int, default=[128, 256, 512])
+    parser.add_argument('--candidates', default=16, type=int)
+    args = parser.parse_args()
+    benchmark(args.dims, args.candidates)
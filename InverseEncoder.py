@@ -0,0 +1,140 @@
+import argparse
+import os
+import time
+import torch
+import torch.nn as nn
+from scipy.stats import genpareto
+from Inversion import Inverter
+from Models import Encoder, load_generator
+
+genpareto_params = (1.33, 0, 0.0075761900937239765)
+threshold = -0.946046018600464
+rv = genpareto(*genpareto_params)
+
+
+class InverseEncoder(nn.Module):
+    """
+    Amortized inverse of G: one forward pass maps a field to its latent, and
+    for the conditional ExGAN generator also to its extremeness code.
+    """
+
+    def __init__(self, latentdim=20, conditional=False):
+        super(InverseEncoder, self).__init__()
+        self.latentdim = latentdim
+        self.conditional = conditional
+        self.encoder = Encoder(encoded_space_dim=latentdim + int(conditional))
+
+    def forward(self, x):
+        out = self.encoder(x)
+        latent = out[:, :self.latentdim].reshape(-1, self.latentdim, 1, 1)
+        if self.conditional:
+            return latent, out[:, self.latentdim:].reshape(-1, 1, 1, 1)
+        return latent, None
+
+
+def sample_code(batch_size, device):
+    """
+    Extremeness codes as drawn by ExGAN.py during training.
+    """
+    probs = torch.rand(batch_size) * 0.95
+    return (torch.as_tensor(rv.ppf(probs), dtype=torch.float32) + threshold).view(-1, 1, 1, 1).to(device)
+
+
+def train(G, latentdim=20, conditional=False, steps=20000, batch_size=256, lr=1e-3, rec_weight=1.0, device='cuda'):
+    """
+    Fits an InverseEncoder on (G(z, code), z, code) pairs drawn from G itself,
+    with a latent loss plus a reconstruction loss through G.
+    """
+    for p in G.parameters():
+        p.requires_grad = False
+    E = InverseEncoder(latentdim, conditional).to(device)
+    optimizer = torch.optim.Adam(E.parameters(), lr=lr)
+    criterion = nn.MSELoss()
+    for step in range(steps):
+        z = torch.randn(batch_size, latentdim, 1, 1, device=device)
+        code = sample_code(batch_size, device) if conditional else None
+        with torch.no_grad():
+            images = G(z, code) if conditional else G(z)
+        z_pred, code_pred = E(images)
+        loss = criterion(z_pred, z)
+        if conditional:
+            loss = loss + criterion(code_pred, code)
+            rec = G(z_pred, code_pred)
+        else:
+            rec = G(z_pred)
+        loss = loss + rec_weight * criterion(rec, images)
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
+        if step % 1000 == 0:
+            print('step', step, 'loss', loss.item())
+    return E.eval()
+
+
+def invert(G, E, real, refine_steps=0, lr=1e-2, device='cuda'):
+    """
+    Latent (and code) of every field from one encoder pass, optionally refined
+    by a few Adam steps through G starting from the prediction.
+    Returns the latent, the code and the MSE per image.
+    """
+    real = real.to(device)
+    with torch.no_grad():
+        latent, code = E(real)
+    if refine_steps > 0:
+        inverter = Inverter(G, E.latentdim, restarts=1, steps=refine_steps, lr=lr,
+                            patience=refine_steps, device=device)
+        latent, loss, _ = inverter.invert(real, code, init=latent)
+        return latent, code, loss
+    with torch.no_grad():
+        rec = G(latent, code) if E.conditional else G(latent)
+    return latent, code, ((rec - real) ** 2).flatten(1).mean(1)
+
+
+def benchmark(G, E, real, refine=(0, 10, 50), steps=2000, device='cuda'):
+    """
+    Images per second and mean MSE of the encoder, with a few refinement steps,
+    against the zero-initialized optimization loop of the RecLoss scripts.
+    """
+    results = {}
+    for k in refine:
+        if device.startswith('cuda'):
+            torch.cuda.synchronize()
+        t = time.time()
+        _, _, loss = invert(G, E, real, k, device=device)
+        if device.startswith('cuda'):
+            torch.cuda.synchronize()
+        results['encoder+{}'.format(k)] = {'images_per_s': len(real) / (time.time() - t), 'mse': loss.mean().item()}
+    with torch.no_grad():
+        _, code = E(real.to(device))
+    if not E.conditional:
+        code = None
+    inverter = Inverter(G, E.latentdim, restarts=1, steps=steps, patience=steps, device=device)
+    _, loss, stats = inverter.invert(real, code)
+    results['adam{}'.format(steps)] = {'images_per_s': 1 / stats['seconds_per_image'], 'mse': loss.mean().item()}
+    for name, row in results.items():
+        print(name, row)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='InverseEncoder')
+    parser.add_argument('--kind', default='dcgan', choices=['dcgan', 'exgan'])
+    parser.add_argument('--run', default='DCGAN', type=str)
+    parser.add_argument('--latentdim', default=20, type=int)
+    parser.add_argument('--steps', default=20000, type=int)
+    parser.add_argument('--batch_size', default=256, type=int)
+    parser.add_argument('--test', default='data/test.pt', type=str)
+    parser.add_argument('--num', default=57, type=int)
+    args = parser.parse_args()
+
+    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    G = load_generator(args.kind, args.run, args.latentdim, device=device)
+    path = os.path.join(args.run, 'E.pt')
+    if os.path.isfile(path):
+        E = InverseEncoder(args.latentdim, args.kind == 'exgan').to(device)
+        E.load_state_dict(torch.load(path, map_location=device))
+        E.eval()
+    else:
+        E = train(G, args.latentdim, args.kind == 'exgan', args.steps, args.batch_size, device=device)
+        torch.save(E.state_dict(), path)
+    benchmark(G, E, torch.load(args.test)[:args.num], device=device)
@@ -0,0 +1,96 @@
+import time
+import torch
+
+
+class Inverter:
+    """
+    Latent inversion of a generator by Adam on z, with `restarts` starts per
+    image optimized as one batch. Restart 0 starts from init (zeros by default,
+    like the RecLoss scripts), the others from init plus N(0, init_scale) noise.
+    Adam runs per row so a restart that stops improving by a relative `tol`
+    for `patience` steps is frozen and dropped from the batch, and the best
+    restart per image is kept.
+    """
+
+    def __init__(self, G, latentdim=20, restarts=8, steps=2000, lr=1e-2, tol=1e-4, patience=100,
+                 init_scale=1.0, betas=(0.9, 0.999), eps=1e-8, device='cuda'):
+        self.G = G
+        self.latentdim = latentdim
+        self.restarts = restarts
+        self.steps = steps
+        self.lr = lr
+        self.tol = tol
+        self.patience = patience
+        self.init_scale = init_scale
+        self.betas = betas
+        self.eps = eps
+        self.device = device
+        for p in G.parameters():
+            p.requires_grad = False
+
+    def starts(self, num, init=None, seed=None):
+        init = init.to(self.device).view(num, self.latentdim, 1, 1) if init is not None \
+            else torch.zeros((num, self.latentdim, 1, 1), device=self.device)
+        z = init.repeat_interleave(self.restarts, 0)
+        generator = torch.Generator(device=self.device).manual_seed(seed) if seed is not None else None
+        noise = torch.randn(z.shape, generator=generator, device=self.device) * self.init_scale
+        noise.view(num, self.restarts, -1)[:, 0] = 0
+        return z + noise
+
+    def invert(self, real, code=None, init=None, seed=None):
+        """
+        Returns the best latent and its MSE per image, and a stats dict with the
+        steps each image ran and the wall time per image.
+        """
+        t = time.time()
+        real = real.to(self.device)
+        num, R = len(real), self.restarts
+        target = real.repeat_interleave(R, 0)
+        code = code.to(self.device).view(num, 1, 1, 1).repeat_interleave(R, 0) if code is not None else None
+
+        z = self.starts(num, init, seed)
+        m, v = torch.zeros_like(z), torch.zeros_like(z)
+        best_z, best_loss = z.clone(), torch.full((num * R,), float('inf'), device=self.device)
+        last_improved = torch.zeros(num * R, dtype=torch.long, device=self.device)
+        steps = torch.full((num * R,), self.steps, dtype=torch.long, device=self.device)
+        active = torch.arange(num * R, device=self.device)
+        beta1, beta2 = self.betas
+
+        for step in range(1, self.steps + 1):
+            z_active = z[active].requires_grad_(True)
+            pred = self.G(z_active, code[active]) if code is not None else self.G(z_active)
+            loss = ((pred - target[active]) ** 2).flatten(1).mean(1)
+            grad, = torch.autograd.grad(loss.sum(), z_active)
+            loss = loss.detach()
+
+            improved = loss < best_loss[active] * (1 - self.tol)
+            better = loss < best_loss[active]
+            best_loss[active[better]] = loss[better]
+            best_z[active[better]] = z[active[better]]
+            last_improved[active[improved]] = step
+
+            with torch.no_grad():
+                m[active] = beta1 * m[active] + (1 - beta1) * grad
+                v[active] = beta2 * v[active] + (1 - beta2) * grad * grad
+                m_hat = m[active] / (1 - beta1 ** step)
+                v_hat = v[active] / (1 - beta2 ** step)
+                z[active] = z[active] - self.lr * m_hat / (v_hat.sqrt() + self.eps)
+
+            stalled = step - last_improved[active] >= self.patience
+            if stalled.any():
+                steps[active[stalled]] = step
+                active = active[~stalled]
+                if len(active) == 0:
+                    break
+
+        best_loss, best_z = best_loss.view(num, R), best_z.view(num, R, self.latentdim, 1, 1)
+        loss, restart = best_loss.min(1)
+        latent = best_z[torch.arange(num, device=self.device), restart]
+        elapsed = time.time() - t
+        stats = {
+            'restart': restart.cpu(),
+            'steps': steps.view(num, R).max(1)[0].cpu(),
+            'seconds_per_image': elapsed / num,
+            'seconds': elapsed,
+        }
+        return latent, loss, stats
@@ -0,0 +1,108 @@
+import json
+import os
+import time
+import numpy as np
+import torch
+import RNGStreams
+from Extremeness import get_extremeness
+from RNGStreams import latents
+from StageCache import file_digest
+
+
+class LatentBank:
+    """
+    Persistent index of pre-scored latents.
+    Latent i is RNGStreams.latents(seed, i), so only its id needs to be stored.
+    ids.npy and scores.npy hold every latent sorted by extremeness.
+    The scores are only valid for the generator checkpoint and RNG scheme
+    recorded in meta.json, open() rebuilds the bank when either changes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.ids = np.load(os.path.join(path, 'ids.npy'), mmap_mode='r')
+        self.scores = np.load(os.path.join(path, 'scores.npy'), mmap_mode='r')
+
+    @classmethod
+    def build(cls, path, G, latentdim, count, seed=0, chunk_size=4096, extremeness='avg', device='cuda',
+              checkpoint=None):
+        os.makedirs(path, exist_ok=True)
+        if os.path.isfile(os.path.join(path, 'meta.json')):
+            os.remove(os.path.join(path, 'meta.json'))
+        criterion = get_extremeness(extremeness)
+        n_chunks = (count + chunk_size - 1) // chunk_size
+        scores = np.empty(count, dtype=np.float32)
+        t = time.time()
+        with torch.no_grad():
+            for chunk in range(n_chunks):
+                ids = np.arange(chunk * chunk_size, min((chunk + 1) * chunk_size, count))
+                latent = latents(seed, ids, latentdim).to(device)
+                scores[ids] = criterion.cal_extreme(G(latent)).cpu().numpy()
+        order = np.argsort(scores, kind='stable')
+        np.save(os.path.join(path, 'ids.npy'), order.astype(np.int64))
+        np.save(os.path.join(path, 'scores.npy'), scores[order])
+        meta = {'seed': seed, 'chunk_size': chunk_size, 'latentdim': latentdim, 'count': count,
+                'extremeness': extremeness, 'build_time': time.time() - t, 'rng_version': RNGStreams.VERSION,
+                'generator': file_digest(checkpoint) if checkpoint else None}
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump(meta, f, indent=2)
+        return cls(path)
+
+    @classmethod
+    def open(cls, path, G, latentdim, count, checkpoint, seed=0, extremeness='avg', device='cuda'):
+        """
+        The bank at path if it was built from this checkpoint with the current
+        RNG scheme, otherwise a freshly built one.
+        """
+        if os.path.isfile(os.path.join(path, 'meta.json')):
+            bank = cls(path)
+            if bank.matches(checkpoint, latentdim, count, seed, extremeness):
+                return bank
+            print('latent bank {} is stale, rebuilding'.format(path))
+        return cls.build(path, G, latentdim, count, seed, extremeness=extremeness, device=device,
+                         checkpoint=checkpoint)
+
+    def matches(self, checkpoint, latentdim, count, seed=0, extremeness='avg'):
+        meta = self.meta
+        return (meta.get('rng_version') == RNGStreams.VERSION and meta.get('generator') == file_digest(checkpoint)
+                and meta['latentdim'] == latentdim and meta['count'] == count and meta['seed'] == seed
+                and meta['extremeness'] == extremeness)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def count(self, val):
+        return len(self.scores) - int(np.searchsorted(self.scores, val, side='left'))
+
+    def query(self, val, n, rng=None):
+        """
+        Ids of up to n latents with extremeness >= val, drawn uniformly among all matches.
+        """
+        start = int(np.searchsorted(self.scores, val, side='left'))
+        matches = np.asarray(self.ids[start:])
+        if len(matches) > n:
+            rng = rng if rng is not None else np.random.default_rng()
+            matches = rng.choice(matches, n, replace=False)
+        return np.sort(matches)
+
+    def latents(self, ids):
+        return latents(self.meta['seed'], ids, self.meta['latentdim'])
+
+    def sample(self, G, val, n, batch_size=1024, device='cuda'):
+        """
+        Regenerate up to n samples with extremeness >= val; fewer if the bank holds fewer.
+        Outputs can differ in the last bits from the build's batch size, so the
+        regenerated images are scored again and the ones that fell below val dropped.
+        """
+        criterion = get_extremeness(self.meta['extremeness'])
+        latent = self.latents(self.query(val, n))
+        images = []
+        with torch.no_grad():
+            for i in range(0, len(latent), batch_size):
+                batch = G(latent[i:i + batch_size].to(device))
+                images.append(batch[criterion.cal_extreme(batch) >= val].cpu())
+        if len(images) == 0:
+            return torch.empty(0)
+        return torch.cat(images, 0)
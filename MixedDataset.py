@@ -0,0 +1,31 @@
+import torch
+from torch.utils.data import Dataset
+
+
+class MixedDataset(Dataset):
+    """
+    Virtual concatenation of real[:nreal] and fake[:nfake].
+    Items are read from the underlying stores on access, nothing is copied;
+    shuffling only permutes an index tensor.
+    """
+
+    def __init__(self, real, fake, nreal, nfake, shuffle=False):
+        self.real = real
+        self.fake = fake
+        self.nreal = min(nreal, len(real))
+        self.nfake = max(min(nfake, len(fake)), 0)
+        self.indices = torch.randperm(len(self)) if shuffle else None
+
+    def __len__(self):
+        return self.nreal + self.nfake
+
+    def index(self, item):
+        if self.indices is not None:
+            item = int(self.indices[item])
+        if item < self.nreal:
+            return self.real, item
+        return self.fake, item - self.nreal
+
+    def __getitem__(self, item):
+        store, idx = self.index(item)
+        return store[idx]
@@ -0,0 +1,154 @@
+import torch
+import torch.nn as nn
+from EMA import generator_checkpoint
+
+
+def convTBNReLU(in_channels, out_channels, kernel_size=4, stride=2, padding=1):
+    return nn.Sequential(
+        nn.ConvTranspose2d(
+            in_channels,
+            out_channels,
+            kernel_size=kernel_size,
+            stride=stride,
+            padding=padding,
+        ),
+        nn.InstanceNorm2d(out_channels),
+        nn.LeakyReLU(0.2, True),
+    )
+
+
+class Generator(nn.Module):
+    def __init__(self, in_channels, out_channels):
+        super(Generator, self).__init__()
+        self.in_channels = in_channels
+        self.out_channels = out_channels
+        self.block1 = convTBNReLU(in_channels, 512, 4, 1, 0)
+        self.block2 = convTBNReLU(512, 256)
+        self.block3 = convTBNReLU(256, 128)
+        self.block4 = convTBNReLU(128, 64)
+        self.block5 = nn.ConvTranspose2d(64, out_channels, 4, 2, 1)
+
+    def forward(self, inp):
+        out = self.block1(inp)
+        out = self.block2(out)
+        out = self.block3(out)
+        out = self.block4(out)
+        return torch.tanh(self.block5(out))
+
+
+class ConditionalGenerator(Generator):
+    """
+    ExGAN generator, the extremeness code is appended to the latent.
+    """
+
+    def __init__(self, in_channels, out_channels):
+        super(ConditionalGenerator, self).__init__(in_channels + 1, out_channels)
+
+    def forward(self, latent, continuous_code):
+        return super(ConditionalGenerator, self).forward(torch.cat((latent, continuous_code), 1))
+
+
+class Transformer(nn.Module):
+    def __init__(self):
+        super(Transformer, self).__init__()
+        self.block1 = nn.Conv2d(1, 4, 3, 1, 1)
+        self.block2 = nn.Conv2d(4, 4, 3, 1, 1)
+        self.block3 = nn.Conv2d(4, 4, 3, 1, 1)
+        self.block4 = nn.Conv2d(4, 1, 3, 1, 1)
+
+    def forward(self, inp):
+        out = self.block1(inp)
+        out = self.block2(out)
+        out = self.block3(out)
+        out = self.block4(out)
+        return out
+
+
+# Conv_AutoEncoder.py writes the encoder state dict here, PGGAN_ae.py and NearestNeighbors.py read it
+ENCODER_CHECKPOINT = 'encoder999.pt'
+ENCODER_DIM = 8
+
+
+class Encoder(nn.Module):
+    """
+    The Conv_AutoEncoder.py encoder, 64x64 fields to encoded_space_dim features.
+    """
+
+    def __init__(self, encoded_space_dim, fc2_input_dim=128):
+        super(Encoder, self).__init__()
+        self.encoder_cnn = nn.Sequential(
+            nn.Conv2d(1, 8, 3, stride=2, padding=1),
+            nn.ReLU(True),
+            nn.Conv2d(8, 16, 3, stride=2, padding=1),
+            nn.BatchNorm2d(16),
+            nn.ReLU(True),
+            nn.Conv2d(16, 32, 3, stride=2, padding=0),
+            nn.BatchNorm2d(32),
+            nn.ReLU(True),
+            nn.Conv2d(32, 64, 3, stride=2, padding=0),
+            nn.BatchNorm2d(64),
+            nn.ReLU(True)
+        )
+        self.flatten = nn.Flatten(start_dim=1)
+        self.encoder_lin = nn.Sequential(
+            nn.Linear(3 * 3 * 64, fc2_input_dim),
+            nn.ReLU(True),
+            nn.Linear(fc2_input_dim, encoded_space_dim)
+        )
+
+    def forward(self, x):
+        x = self.encoder_cnn(x)
+        x = self.flatten(x)
+        x = self.encoder_lin(x)
+        return x
+
+
+class PGGANSampler(nn.Module):
+    """
+    The PGGAN_sampling.py pipeline as one module: G, per-sample max
+    subtraction, exponential noise, GPD transform and T, rescaled to [0, 1].
+    """
+
+    def __init__(self, G, T, sigma, gamma, simple=False):
+        super(PGGANSampler, self).__init__()
+        self.G = G
+        self.T = T
+        self.simple = simple
+        self.register_buffer('sigma', sigma)
+        self.register_buffer('gamma', gamma)
+
+    def forward(self, latent, e_samples):
+        fakeData = self.G(latent)
+        max_value = torch.amax(fakeData, dim=(1, 2, 3), keepdim=True)
+        G_samples = fakeData - max_value
+        if self.simple:
+            G_extremes = self.sigma * (G_samples + e_samples)
+        else:
+            G_extremes = self.sigma / self.gamma * torch.exp(self.gamma * (G_samples + e_samples) - 1)
+        return 0.5 * (self.T(G_extremes) + 1)
+
+
+def load_generator(kind, dirname, latentdim=20, epoch=999, device='cuda', checkpoint=None):
+    """
+    Generator of a trained run, kind is dcgan or exgan; EMA weights are preferred
+    unless an explicit checkpoint file is given.
+    """
+    if kind == 'exgan':
+        G = ConditionalGenerator(in_channels=latentdim, out_channels=1)
+    else:
+        G = Generator(in_channels=latentdim, out_channels=1)
+    checkpoint = checkpoint or generator_checkpoint(dirname, epoch)
+    G.load_state_dict(torch.load(checkpoint, map_location=device))
+    return G.to(device).eval()
+
+
+def load_pggan(dirname, model='finetune', simple=False, latentdim=20, epoch=999, device='cuda', checkpoint=None):
+    G = load_generator('pggan', dirname, latentdim, epoch, device, checkpoint)
+    if model == 'finetune':
+        T = Transformer()
+        T.load_state_dict(torch.load('{}/T{}.pt'.format(dirname, epoch), map_location=device))
+    else:
+        T = nn.Identity()
+    sigma = torch.load('{}/sigma{}.pt'.format(dirname, epoch), map_location=device)
+    gamma = torch.load('{}/gamma{}.pt'.format(dirname, epoch), map_location=device)
+    return PGGANSampler(G, T, sigma, gamma, simple).to(device).eval()
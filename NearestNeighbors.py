@@ -0,0 +1,163 @@
+import argparse
+import csv
+import os
+import time
+import numpy as np
+import torch
+import FID
+from EmbeddingCache import EmbeddingCache
+from Models import ENCODER_CHECKPOINT, ENCODER_DIM, Encoder
+from SampleStore import fields
+
+
+def kmeans(x, k, iters=20, seed=0):
+    """
+    Lloyd's k-means, centroids initialized on k distinct points.
+    """
+    rng = np.random.default_rng(seed)
+    centroids = x[rng.choice(len(x), k, replace=False)].copy()
+    for _ in range(iters):
+        assign = squared_distances(x, centroids).argmin(1)
+        counts = np.bincount(assign, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, x)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+    return centroids
+
+
+def squared_distances(a, b):
+    d = (a * a).sum(1)[:, None] - 2 * a.dot(b.T) + (b * b).sum(1)[None, :]
+    return np.maximum(d, 0)
+
+
+class IVFIndex:
+    """
+    Inverted-file index over embeddings: the corpus is split into nlist
+    k-means cells and a query only scans the nprobe cells nearest to it.
+    Members of a cell are stored contiguously, so each cell is scanned with
+    one matrix product for all the queries probing it.
+    """
+
+    def __init__(self, data, nlist=None, iters=20, seed=0):
+        self.data = np.ascontiguousarray(data, dtype=np.float32)
+        self.nlist = nlist or max(1, int(np.sqrt(len(self.data))))
+        self.centroids = kmeans(self.data, self.nlist, iters, seed)
+        assign = squared_distances(self.data, self.centroids).argmin(1)
+        self.order = np.argsort(assign, kind='stable')
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=self.nlist))])
+        self.cells = self.data[self.order]
+        self.norms = (self.cells * self.cells).sum(1)
+
+    def search(self, queries, nprobe=8):
+        """
+        Distance and corpus row of the nearest neighbour of every query.
+        """
+        queries = np.ascontiguousarray(queries, dtype=np.float32)
+        nprobe = min(nprobe, self.nlist)
+        probes = np.argsort(squared_distances(queries, self.centroids), 1)[:, :nprobe]
+        best = np.full(len(queries), np.inf, dtype=np.float32)
+        ids = np.full(len(queries), -1, dtype=np.int64)
+        q_norms = (queries * queries).sum(1)
+        for cell in range(self.nlist):
+            lo, hi = self.offsets[cell], self.offsets[cell + 1]
+            rows = np.nonzero((probes == cell).any(1))[0]
+            if hi == lo or len(rows) == 0:
+                continue
+            d = q_norms[rows, None] - 2 * queries[rows].dot(self.cells[lo:hi].T) + self.norms[None, lo:hi]
+            arg = d.argmin(1)
+            dist = d[np.arange(len(rows)), arg]
+            better = dist < best[rows]
+            best[rows[better]] = dist[better]
+            ids[rows[better]] = self.order[lo + arg[better]]
+        return np.sqrt(np.maximum(best, 0)), ids
+
+
+def exact_search(data, queries, chunk=4096, exclude_self=False):
+    data = np.asarray(data, dtype=np.float32)
+    queries = np.asarray(queries, dtype=np.float32)
+    dist, ids = [], []
+    for i in range(0, len(queries), chunk):
+        d = squared_distances(queries[i:i + chunk], data)
+        if exclude_self:
+            d[np.arange(len(d)), np.arange(i, i + len(d))] = np.inf
+        arg = d.argmin(1)
+        ids.append(arg)
+        dist.append(np.sqrt(d[np.arange(len(d)), arg]))
+    return np.concatenate(dist), np.concatenate(ids)
+
+
+def embedder(features, train='../data/test.pt', cache='fid_cache/', encoder=ENCODER_CHECKPOINT, d=ENCODER_DIM):
+    """
+    Cache name, model and whether it takes flattened fields, for either the
+    FID AutoEncoder features or the Conv_AutoEncoder.py encoder.
+    """
+    if features == 'fid':
+        ae, _ = FID.load_extractor(train, cache)
+        return 'fid', ae.encoder, True
+    model = Encoder(encoded_space_dim=d, fc2_input_dim=128)
+    model.load_state_dict(torch.load(encoder))
+    return 'conv{}'.format(d), model, False
+
+
+def check_scale(path, unit=False):
+    """
+    Real fields on [-1, 1] always have dry pixels at -1, so a tensor file with
+    no negative value was saved rescaled to [0, 1] and needs unit.
+    """
+    if unit or os.path.isdir(path):
+        return
+    batch = next(fields(path, 4096))
+    if batch.min() >= 0:
+        raise ValueError('{} looks rescaled to [0, 1], pass --unit'.format(path))
+
+
+def memorization(corpus, samples, nlist=None, nprobe=8, quantile=0.01):
+    """
+    Nearest corpus row and distance of every sample. Samples closer than the
+    `quantile` of the corpus' own nearest-other-day distances are flagged.
+    """
+    index = IVFIndex(corpus, nlist)
+    t = time.time()
+    dist, ids = index.search(samples, nprobe)
+    rate = len(samples) / max(time.time() - t, 1e-9)
+    baseline = np.quantile(exact_search(corpus, corpus, exclude_self=True)[0], quantile)
+    return {'distance': dist, 'day': ids, 'copy': dist < baseline, 'baseline': baseline,
+            'queries_per_s': rate, 'index': index}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='NearestNeighbors')
+    parser.add_argument('--corpus', default='data/real.pt', type=str)
+    parser.add_argument('--samples', required=True, type=str, help='tensor file or SampleStore folder')
+    parser.add_argument('--features', default='conv', choices=['conv', 'fid'])
+    parser.add_argument('--unit', action='store_true', default=False,
+                        help='--samples is a tensor file saved as 0.5 * (x + 1)')
+    parser.add_argument('--encoder', default=ENCODER_CHECKPOINT, type=str,
+                        help='Encoder state dict for conv features, as written by Conv_AutoEncoder.py')
+    parser.add_argument('--d', default=ENCODER_DIM, type=int, help='encoded_space_dim of --encoder')
+    parser.add_argument('--train', default='../data/test.pt', type=str, help='FID extractor training data')
+    parser.add_argument('--cache', default='fid_cache/', type=str)
+    parser.add_argument('--embeddings', default='embedding_cache/', type=str)
+    parser.add_argument('--nlist', default=None, type=int)
+    parser.add_argument('--nprobe', default=8, type=int)
+    parser.add_argument('--quantile', default=0.01, type=float)
+    parser.add_argument('--check', default=1000, type=int, help='queries checked against exact search for recall')
+    parser.add_argument('--out', default='nearest.csv', type=str)
+    args = parser.parse_args()
+
+    name, model, flatten = embedder(args.features, args.train, args.cache, args.encoder, args.d)
+    embeddings = EmbeddingCache(args.embeddings)
+    corpus = embeddings.get(model, args.corpus, name, flatten)
+    check_scale(args.samples, args.unit)
+    samples = embeddings.get(model, args.samples, name, flatten, unit=args.unit)
+    result = memorization(corpus, samples, args.nlist, args.nprobe, args.quantile)
+    check = min(args.check, len(samples))
+    _, exact_ids = exact_search(corpus, samples[:check])
+    print('queries/sec', result['queries_per_s'], 'recall@1', (exact_ids == result['day'][:check]).mean(),
+          'copies', int(result['copy'].sum()), 'of', len(samples))
+    with open(args.out, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['sample', 'day', 'distance', 'copy'])
+        for i in range(len(samples)):
+            writer.writerow([i, int(result['day'][i]), float(result['distance'][i]), bool(result['copy'][i])])
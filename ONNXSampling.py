@@ -0,0 +1,47 @@
+import argparse
+import time
+import numpy as np
+import onnxruntime as ort
+from RNGStreams import exponential_array, latent_array
+
+
+class ONNXSampler:
+    """
+    Runs the exported PGGAN sampling graph with onnxruntime; needs only numpy.
+    Noise follows RNGStreams, so sample i matches PGGAN_sampling.py --seed.
+    """
+
+    def __init__(self, path, threads=0):
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        inputs = {i.name: i.shape for i in self.session.get_inputs()}
+        self.latentdim = inputs['latent'][1]
+        self.img_shape = list(inputs['e_samples'][1:])
+
+    def run(self, latent, e_samples):
+        return self.session.run(['samples'], {'latent': latent, 'e_samples': e_samples})[0]
+
+    def sample(self, n, seed=0, start=0, batch_size=256):
+        out = []
+        for i in range(start, start + n, batch_size):
+            index = np.arange(i, min(i + batch_size, start + n))
+            out.append(self.run(latent_array(seed, index, self.latentdim),
+                                exponential_array(seed, index, self.img_shape)))
+        return np.concatenate(out, 0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='ONNXSampling')
+    parser.add_argument('--onnx', default='pggan.onnx', type=str)
+    parser.add_argument('--n', default=100, type=int)
+    parser.add_argument('--seed', default=0, type=int)
+    parser.add_argument('--out', default='PxGAN_sample.npy', type=str)
+    args = parser.parse_args()
+
+    sampler = ONNXSampler(args.onnx)
+    t = time.time()
+    samples = sampler.sample(args.n, args.seed)
+    print(time.time() - t)
+    np.save(args.out, samples)
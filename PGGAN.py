@@ -13,6 +13,7 @@ from torch import LongTensor, FloatTensor
 from scipy.stats import skewnorm, genpareto
 from torchvision.utils import save_image
 import sys
+from EMA import EMA
 
 import argparse
 parser = argparse.ArgumentParser(description='PGGAN')
@@ -25,6 +26,7 @@ parser.add_argument('--dataset', default='real', type=str)
 # Model options
 parser.add_argument('--model', default='finetune', type=str)
 parser.add_argument('--simple', action='store_true', default=False)
+parser.add_argument('--ema_decay', default=0.999, type=float)
 
 args = parser.parse_args()
 
@@ -231,6 +233,7 @@ def main():
     T.apply(weights_init_normal)
 
     optimizerG = optim.Adam(G.parameters(), lr=0.0002, betas=(0.5, 0.999))
+    G_ema = EMA(G, args.ema_decay)
     optimizerD = optim.Adam(D.parameters(), lr=0.0001, betas=(0.5, 0.999))
     optimizerA = optim.Adam(A.parameters(), lr=0.0001, betas=(0.5, 0.999))
     optimizerT = optim.Adam(T.parameters(), lr=0.0001, betas=(0.5, 0.999))
@@ -331,6 +334,7 @@ def main():
             torch.nn.utils.clip_grad_norm_(G.parameters(),20)
             torch.nn.utils.clip_grad_norm_(A.parameters(),20)
             optimizerG.step()
+            G_ema.update()
             optimizerA.step()
             
             mu = mu.detach()
@@ -343,6 +347,7 @@ def main():
             board.add_scalar('lossG', lossG.item(), step)
         if (epoch + 1) % 50 == 0:
             torch.save(G.state_dict(), DIRNAME + "/G" + str(epoch) + ".pt")
+            torch.save(G_ema.state_dict(), DIRNAME + "/G_ema" + str(epoch) + ".pt")
             torch.save(D.state_dict(), DIRNAME + "/D" + str(epoch) + ".pt")
             torch.save(T.state_dict(), DIRNAME + "/T" + str(epoch) + ".pt")
             torch.save(mu, DIRNAME + "/mu" + str(epoch) + ".pt")
@@ -13,6 +13,9 @@ from torch import LongTensor, FloatTensor
 from scipy.stats import skewnorm, genpareto
 from torchvision.utils import save_image
 import sys
+from EMA import EMA
+from EmbeddingCache import EmbeddingCache
+from Models import ENCODER_CHECKPOINT, ENCODER_DIM
 
 class NWSDataset(Dataset):
     """
@@ -22,17 +25,19 @@ class NWSDataset(Dataset):
     def __init__(
         self, path='/mnt/home/junli/PGGAN/data/', dsize=2556
     ):
-        self.real = torch.load(path+'real.pt').cuda()
+        self.path = path + 'real.pt'
+        self.real = torch.load(self.path).cuda()
         self.indices = np.random.permutation(dsize)
         self.real.requires_grad = False
+        self.embeddings = None
         
     def __len__(self):
         return self.real.shape[0]
 
     def __getitem__(self, item):
-        return self.real[self.indices[item]]
+        return self.real[self.indices[item]], self.embeddings[self.indices[item]]
 
-dataloader = DataLoader(NWSDataset(), batch_size=256, shuffle=True)
+dataset = NWSDataset()
 
 def weights_init_normal(m):
     classname = m.__class__.__name__
@@ -214,11 +219,14 @@ class Decoder(nn.Module):
         x = torch.sigmoid(x)
         return x
 
-d = 8
+d = ENCODER_DIM
 encoder = Encoder(encoded_space_dim=d,fc2_input_dim=128)
 decoder = Decoder(encoded_space_dim=d,fc2_input_dim=128)
-encoder.load_state_dict(torch.load('encoder999.pt'))
+encoder.load_state_dict(torch.load(ENCODER_CHECKPOINT))
 decoder.load_state_dict(torch.load('decoder999.pt'))
+# the corpus is encoded once per encoder and reused across runs
+dataset.embeddings = torch.from_numpy(np.array(EmbeddingCache().get(encoder, dataset.path, 'conv{}'.format(d)))).cuda()
+dataloader = DataLoader(dataset, batch_size=256, shuffle=True)
 
 
 n_criteria = 1
@@ -237,7 +245,9 @@ G.apply(weights_init_normal)
 D.apply(weights_init_normal)
 A.apply(weights_init_normal)
 
+ema_decay = 0.999
 optimizerG = optim.Adam(G.parameters(), lr=0.0002, betas=(0.5, 0.999))
+G_ema = EMA(G, ema_decay)
 optimizerD = optim.Adam(D.parameters(), lr=0.0001, betas=(0.5, 0.999))
 optimizerA = optim.Adam(A.parameters(), lr=0.0001, betas=(0.5, 0.999))
 static_z = Variable(FloatTensor(torch.randn((81, latentdim, 1, 1)))).cuda()
@@ -306,7 +316,7 @@ acc_list = []
 
 for epoch in range(1000):
     print(epoch)
-    for images in dataloader:
+    for images, features in dataloader:
         mu_val, sigma_val = A(images)
         print('mu_val size', mu_val.size())
         mu_incre = torch.mean(torch.abs(mu_val),dim=0)
@@ -322,7 +332,7 @@ for epoch in range(1000):
         extreme_grad = avg_extreme_grad(extreme_samples, mu)
         extreme_samples = extreme_samples - extreme_grad
         
-        hidden_features = encoder(extreme_samples)
+        hidden_features = features[extreme_flags]
         
         
         n_extremes = len(extreme_samples)
@@ -382,6 +392,7 @@ for epoch in range(1000):
         torch.nn.utils.clip_grad_norm_(G.parameters(),20)
         torch.nn.utils.clip_grad_norm_(A.parameters(),20)
         optimizerG.step()
+        G_ema.update()
         optimizerA.step()
         
         board.add_scalar('realLoss', realLoss.item(), step)
@@ -390,6 +401,7 @@ for epoch in range(1000):
         board.add_scalar('lossG', lossG.item(), step)
     if (epoch + 1) % 50 == 0:
         torch.save(G.state_dict(), DIRNAME + "G" + str(epoch) + ".pt")
+        torch.save(G_ema.state_dict(), DIRNAME + "G_ema" + str(epoch) + ".pt")
         torch.save(D.state_dict(), DIRNAME + "D" + str(epoch) + ".pt")
     if (epoch + 1) % 10 == 0:   
         with torch.no_grad():
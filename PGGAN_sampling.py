@@ -9,6 +9,9 @@ from scipy.stats import genpareto
 import torch.nn.functional as F
 from torch.autograd import Variable
 from torch import FloatTensor
+from EMA import generator_checkpoint
+from SampleStore import ShardWriter
+import RNGStreams
 
 import argparse
 parser = argparse.ArgumentParser(description='PGGAN_sampling')
@@ -22,6 +25,15 @@ parser.add_argument('--save', default='', type=str,
 parser.add_argument('--model', default='finetune', type=str)
 parser.add_argument('--simple', action='store_true', default=False)
 
+# Output options
+parser.add_argument('--n', default=100, type=int, help='number of samples')
+parser.add_argument('--batch_size', default=1024, type=int)
+parser.add_argument('--store', default='', type=str,
+                    help='stream samples into memory-mapped shards in this folder instead of one .pt file')
+parser.add_argument('--seed', default=None, type=int,
+                    help='derive the noise of sample i from (seed, i) so any range of samples can be regenerated')
+parser.add_argument('--start', default=0, type=int, help='index of the first sample, used with --seed')
+
 args = parser.parse_args()
 
 def convTBNReLU(in_channels, out_channels, kernel_size=4, stride=2, padding=1):
@@ -146,7 +158,7 @@ class Transformer(nn.Module):
 latentdim = 20
 img_size = [64, 64]
 G = Generator(in_channels=latentdim, out_channels=1).cuda()
-G.load_state_dict(torch.load('{}/G999.pt'.format(args.save)))
+G.load_state_dict(torch.load(generator_checkpoint(args.save)))
 G.eval()
 if args.model == 'finetune':
     T = Transformer().cuda()
@@ -158,18 +170,35 @@ sigma = torch.load('{}/sigma999.pt'.format(args.save)).cuda()
 gamma = torch.load('{}/gamma999.pt'.format(args.save)).cuda()
 e = torch.distributions.exponential.Exponential(torch.ones([1] + img_size))
 
+
+def sample(start, n):
+    if args.seed is None:
+        latent = Variable(FloatTensor(torch.randn(n, latentdim, 1, 1))).cuda()
+        e_samples = e.rsample([n]).cuda()
+    else:
+        index = np.arange(start, start + n)
+        latent = RNGStreams.latents(args.seed, index, latentdim).cuda()
+        e_samples = RNGStreams.exponentials(args.seed, index, [1] + img_size).cuda()
+    fakeData = G(latent)
+    max_value, _ = torch.max(torch.reshape(fakeData, [n, -1]), dim=1)
+    max_value = torch.reshape(max_value, [-1, 1, 1, 1])
+    G_samples = fakeData - max_value
+    if args.simple == True:
+        G_extremes = sigma * (G_samples + e_samples)
+    else:
+        G_extremes = sigma / gamma * torch.exp(gamma * (G_samples + e_samples) - 1)
+    return T(G_extremes)
+
+
 t = time.time()
-latent = Variable(FloatTensor(torch.randn(100, latentdim, 1, 1))).cuda()
-fakeData = G(latent)
-max_value, _ = torch.max(torch.reshape(fakeData, [100, -1]), dim=1)
-max_value = torch.reshape(max_value, [-1, 1, 1, 1])
-G_samples = fakeData - max_value
-e_samples = e.rsample([len(G_samples)]).cuda()
-if args.simple == True:
-    G_extremes = sigma * (G_samples + e_samples)
-else:
-    G_extremes = sigma / gamma * torch.exp(gamma * (G_samples + e_samples) - 1)
-    
-G_extremes = T(G_extremes)
+with torch.no_grad():
+    if args.store:
+        with ShardWriter(args.store, [1] + img_size, meta={'seed': args.seed}, total=args.n) as writer:
+            for i in range(args.start, args.start + args.n, args.batch_size):
+                size = min(args.batch_size, args.start + args.n - i)
+                writer.write(0.5*(sample(i, size)+1), seeds=np.arange(i, i + size))
+    else:
+        G_extremes = sample(args.start, args.n)
 print(time.time() - t)
-torch.save(0.5*(G_extremes+1), '{}/PxGAN_sample.pt'.format(args.save))
+if not args.store:
+    torch.save(0.5*(G_extremes+1), '{}/PxGAN_sample.pt'.format(args.save))
@@ -9,6 +9,7 @@ from scipy.stats import genpareto
 import torch.nn.functional as F
 from torch.autograd import Variable
 from torch import FloatTensor
+from EMA import generator_checkpoint
 
 
 def convTBNReLU(in_channels, out_channels, kernel_size=4, stride=2, padding=1):
@@ -49,7 +50,7 @@ genpareto_params = (1.33, 0, 0.0075761900937239765)
 threshold = -0.946046018600464
 rv = genpareto(*genpareto_params)
 
-G.load_state_dict(torch.load('DCGAN_1dexpo/G999.pt'))
+G.load_state_dict(torch.load(generator_checkpoint('DCGAN_1dexpo')))
 G.eval()
 img_size = [64, 64]
 e = torch.distributions.exponential.Exponential(torch.ones([1]))
@@ -13,6 +13,7 @@ from torch import LongTensor, FloatTensor
 from scipy.stats import skewnorm, genpareto
 from torchvision.utils import save_image
 import sys
+from EMA import EMA
 from Extremeness import AvgExtremeness, MaxExtremeness
 
 
@@ -177,7 +178,9 @@ T.apply(weights_init_normal)
 
 
 
+ema_decay = 0.999
 optimizerG = optim.Adam(G.parameters(), lr=0.0002, betas=(0.5, 0.999))
+G_ema = EMA(G, ema_decay)
 optimizerD = optim.Adam(D.parameters(), lr=0.0001, betas=(0.5, 0.999))
 optimizerA = optim.Adam(A.parameters(), lr=0.0001, betas=(0.5, 0.999))
 optimizerT = optim.Adam(T.parameters(), lr=0.0001, betas=(0.5, 0.999))
@@ -324,6 +327,7 @@ for epoch in range(1000):
         torch.nn.utils.clip_grad_norm_(G.parameters(),20)
         torch.nn.utils.clip_grad_norm_(A.parameters(),20)
         optimizerG.step()
+        G_ema.update()
         optimizerA.step()
         
         board.add_scalar('realLoss', realLoss.item(), step)
@@ -332,6 +336,7 @@ for epoch in range(1000):
         board.add_scalar('lossG', lossG.item(), step)
     if (epoch + 1) % 50 == 0:
         torch.save(G.state_dict(), DIRNAME + "G" + str(epoch) + ".pt")
+        torch.save(G_ema.state_dict(), DIRNAME + "G_ema" + str(epoch) + ".pt")
         torch.save(D.state_dict(), DIRNAME + "D" + str(epoch) + ".pt")
     if (epoch + 1) % 10 == 0:   
         with torch.no_grad():
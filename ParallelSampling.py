@@ -0,0 +1,137 @@
+import argparse
+import json
+import os
+import shutil
+import time
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+from scipy.stats import genpareto
+import RNGStreams
+from ConditionalSampling import tau_to_val
+from Models import load_generator, load_pggan
+from SampleStore import ShardWriter
+
+genpareto_params = (1.33, 0, 0.0075761900937239765)
+threshold = -0.946046018600464
+rv = genpareto(*genpareto_params)
+
+worker = {}
+
+
+def init_worker(model, kind, threads):
+    torch.set_num_threads(threads)
+    worker['model'] = model
+    worker['kind'] = kind
+
+
+def generate(model, kind, seed, index, latentdim=20, val=None):
+    latent = RNGStreams.latents(seed, index, latentdim)
+    with torch.no_grad():
+        if kind == 'pggan':
+            return model(latent, RNGStreams.exponentials(seed, index, [1] + list(model.sigma.shape)))
+        if kind == 'exgan':
+            return 0.5 * (model(latent, torch.full((len(index), 1, 1, 1), float(val))) + 1)
+        return 0.5 * (model(latent) + 1)
+
+
+def run_task(task):
+    """
+    Samples [start, start + n) of the job, written to their own shard folder.
+    """
+    root, seed, start, n, batch_size, val, tau = task
+    t = time.time()
+    with ShardWriter(root, [1, 64, 64], meta={'seed': seed, 'start': start}, total=n) as writer:
+        for i in range(start, start + n, batch_size):
+            index = np.arange(i, min(i + batch_size, start + n))
+            writer.write(generate(worker['model'], worker['kind'], seed, index, val=val), seeds=index, tau=tau)
+    return time.time() - t
+
+
+def merge(root, parts):
+    """
+    Moves the shards of every part, in order, into one SampleStore at root.
+    """
+    shards, total, meta = [], 0, {}
+    for part in parts:
+        with open(os.path.join(part, 'meta.json')) as f:
+            meta = json.load(f)
+        for i, size in enumerate(meta['shards']):
+            for suffix in ['', '.index']:
+                os.replace(os.path.join(part, 'shard{:05d}{}.npy'.format(i, suffix)),
+                           os.path.join(root, 'shard{:05d}{}.npy'.format(len(shards), suffix)))
+            shards.append(size)
+        total += meta['total']
+        shutil.rmtree(part)
+    with open(os.path.join(root, 'meta.json'), 'w') as f:
+        json.dump({'seed': meta.get('seed'), 'shards': shards, 'total': total,
+                   'sample_shape': meta.get('sample_shape', [1, 64, 64])}, f)
+
+
+def run(model, kind, root, n, workers, seed=0, task_size=4096, batch_size=256, val=None, threads=None,
+        tau=float('nan')):
+    """
+    Splits [0, n) into tasks of task_size samples and runs them on a pool of
+    workers sharing one copy of the model. Returns samples/sec. tau is only
+    recorded in the store index.
+    """
+    threads = threads or max(1, (os.cpu_count() or 1) // workers)
+    os.makedirs(root, exist_ok=True)
+    tasks = [(os.path.join(root, 'part{:05d}'.format(j)), seed, start, min(task_size, n - start), batch_size, val,
+              tau)
+             for j, start in enumerate(range(0, n, task_size))]
+    t = time.time()
+    with mp.get_context('spawn').Pool(workers, initializer=init_worker, initargs=(model, kind, threads)) as pool:
+        pool.map(run_task, tasks, chunksize=1)
+    elapsed = time.time() - t
+    merge(root, [task[0] for task in tasks])
+    return n / elapsed
+
+
+def scaling(model, kind, root, n, max_workers, **kwargs):
+    """
+    Throughput and parallel efficiency of the same job for 1, 2, 4, ... max_workers workers.
+    """
+    results = {}
+    counts = sorted(set([2 ** i for i in range(int(np.log2(max_workers)) + 1)] + [max_workers]))
+    for workers in counts:
+        rate = run(model, kind, os.path.join(root, 'scaling{}'.format(workers)), n, workers, **kwargs)
+        shutil.rmtree(os.path.join(root, 'scaling{}'.format(workers)))
+        results[workers] = {'samples_per_sec': rate, 'efficiency': rate / (results[1]['samples_per_sec'] * workers)
+                            if 1 in results else 1.0}
+        print('workers', workers, results[workers])
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='ParallelSampling')
+    parser.add_argument('--kind', default='pggan', choices=['dcgan', 'exgan', 'pggan'])
+    parser.add_argument('--save', default='', type=str, help='run directory holding the checkpoints')
+    parser.add_argument('--model', default='finetune', type=str)
+    parser.add_argument('--simple', action='store_true', default=False)
+    parser.add_argument('--store', default='samples', type=str)
+    parser.add_argument('--n', default=100000, type=int)
+    parser.add_argument('--workers', default=os.cpu_count(), type=int)
+    parser.add_argument('--threads', default=None, type=int, help='torch threads per worker')
+    parser.add_argument('--seed', default=0, type=int)
+    parser.add_argument('--tau', default=0.01, type=float, help='extremeness probability for exgan')
+    parser.add_argument('--task_size', default=4096, type=int)
+    parser.add_argument('--batch_size', default=256, type=int)
+    parser.add_argument('--scaling', action='store_true', default=False,
+                        help='report scaling efficiency from 1 to --workers workers instead of writing a store')
+    args = parser.parse_args()
+
+    if args.kind == 'pggan':
+        model = load_pggan(args.save, args.model, args.simple, device='cpu')
+    else:
+        model = load_generator(args.kind, args.save, device='cpu')
+    model.share_memory()
+    val = float(tau_to_val([args.tau], rv, threshold)[0]) if args.kind == 'exgan' else None
+    tau = args.tau if args.kind == 'exgan' else float('nan')
+    kwargs = dict(seed=args.seed, task_size=args.task_size, batch_size=args.batch_size, val=val, threads=args.threads,
+                  tau=tau)
+    if args.scaling:
+        scaling(model, args.kind, args.store, args.n, args.workers, **kwargs)
+    else:
+        rate = run(model, args.kind, args.store, args.n, args.workers, **kwargs)
+        print('samples/sec', rate)
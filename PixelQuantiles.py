@@ -0,0 +1,137 @@
+import argparse
+import numpy as np
+import matplotlib.pyplot as plt
+from SampleStore import fields
+
+
+class PixelHistogram:
+    """
+    Per-pixel quantile sketch: a fixed-bin histogram over [lo, hi] for every
+    pixel, plus an underflow and an overflow bin. One streaming pass fills it,
+    sketches from several workers merge by adding counts, and any quantile is
+    read back to within one bin width (quantiles in the outer bins are clipped
+    to lo or hi).
+    """
+
+    def __init__(self, shape, lo=-1.0, hi=1.0, bins=1024):
+        self.shape = tuple(shape)
+        self.pixels = int(np.prod(self.shape))
+        self.lo, self.hi, self.bins = float(lo), float(hi), int(bins)
+        self.width = (self.hi - self.lo) / self.bins
+        self.count = 0
+        self.counts = np.zeros((self.bins + 2, self.pixels), dtype=np.int64)
+
+    def update(self, batch):
+        x = np.asarray(batch, dtype=np.float64).reshape(-1, self.pixels)
+        idx = np.clip(np.floor((x - self.lo) / self.width).astype(np.int64) + 1, 0, self.bins + 1)
+        flat = (idx * self.pixels + np.arange(self.pixels)).ravel()
+        self.counts += np.bincount(flat, minlength=self.counts.size).reshape(self.counts.shape)
+        self.count += len(x)
+        return self
+
+    def merge(self, other):
+        assert (self.shape, self.lo, self.hi, self.bins) == (other.shape, other.lo, other.hi, other.bins), \
+            "Sketches with different bins"
+        self.counts += other.counts
+        self.count += other.count
+        return self
+
+    def quantiles(self, qs):
+        """
+        Maps of shape (len(qs),) + shape, linearly interpolated inside the bin.
+        """
+        cum = np.cumsum(self.counts, 0)
+        maps = []
+        for q in np.atleast_1d(qs):
+            target = q * self.count
+            b = np.minimum((cum < target).sum(0), self.bins + 1)
+            below = np.where(b > 0, cum[np.maximum(b - 1, 0), np.arange(self.pixels)], 0)
+            inside = self.counts[b, np.arange(self.pixels)]
+            frac = np.where(inside > 0, (target - below) / np.maximum(inside, 1), 0)
+            value = self.lo + (b - 1 + frac) * self.width
+            maps.append(np.clip(value, self.lo, self.hi).reshape(self.shape))
+        return np.stack(maps)
+
+    def exceedance(self, level):
+        """
+        Per-pixel fraction of samples above level (a scalar or a map), with the
+        bin holding the level split linearly.
+        """
+        level = np.broadcast_to(np.asarray(level, dtype=np.float64), self.shape).ravel()
+        pos = np.clip((level - self.lo) / self.width, 0, self.bins)
+        b = np.floor(pos).astype(np.int64) + 1
+        above = np.cumsum(self.counts[::-1], 0)[::-1]
+        tail = np.where(b <= self.bins, above[np.minimum(b + 1, self.bins + 1), np.arange(self.pixels)], 0)
+        tail = tail + self.counts[b, np.arange(self.pixels)] * (b - pos)
+        return (tail / max(self.count, 1)).reshape(self.shape)
+
+    def save(self, path):
+        np.savez(path, shape=self.shape, lo=self.lo, hi=self.hi, bins=self.bins, count=self.count, counts=self.counts)
+
+    @classmethod
+    def load(cls, path):
+        state = np.load(path)
+        sketch = cls(tuple(state['shape']), float(state['lo']), float(state['hi']), int(state['bins']))
+        sketch.count, sketch.counts = int(state['count']), state['counts']
+        return sketch
+
+
+def sketch(path, shape=(1, 64, 64), lo=-1.0, hi=1.0, bins=1024, batch_size=4096):
+    result = PixelHistogram(shape, lo, hi, bins)
+    for batch in fields(path, batch_size):
+        result.update(batch)
+    return result
+
+
+def compare(real, fake, qs=(0.95, 0.99, 0.999)):
+    """
+    Per-pixel quantiles of both sketches, their difference (fake - real) and
+    the exceedance rate of the fake samples over the real quantile maps.
+    """
+    real_q, fake_q = real.quantiles(qs), fake.quantiles(qs)
+    return {'q': np.asarray(qs), 'real': real_q, 'fake': fake_q, 'diff': fake_q - real_q,
+            'fake_exceedance': np.stack([fake.exceedance(level) for level in real_q])}
+
+
+def plot(result, path):
+    qs = result['q']
+    fig, axes = plt.subplots(3, len(qs), figsize=(4 * len(qs), 12), squeeze=False)
+    for j, q in enumerate(qs):
+        for i, name in enumerate(['real', 'fake', 'diff']):
+            im = axes[i, j].imshow(result[name][j].squeeze(), cmap='RdBu_r' if name == 'diff' else 'viridis')
+            axes[i, j].set_title('{} q={}'.format(name, q))
+            fig.colorbar(im, ax=axes[i, j])
+    fig.savefig(path)
+    plt.close(fig)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='PixelQuantiles')
+    parser.add_argument('--real', default='data/real.pt', type=str)
+    parser.add_argument('--fake', default='', type=str, help='tensor file or SampleStore folder')
+    parser.add_argument('--bins', default=1024, type=int)
+    parser.add_argument('--lo', default=-1.0, type=float)
+    parser.add_argument('--hi', default=1.0, type=float)
+    parser.add_argument('--q', nargs='*', type=float, default=[0.95, 0.99, 0.999])
+    parser.add_argument('--partial', default='', type=str,
+                        help='only sketch --fake and save the partial sketch to this .npz')
+    parser.add_argument('--merge', nargs='*', default=[], help='partial fake sketches to compare instead of --fake')
+    parser.add_argument('--out', default='pixel_quantiles', type=str)
+    args = parser.parse_args()
+
+    if args.partial:
+        sketch(args.fake, lo=args.lo, hi=args.hi, bins=args.bins).save(args.partial)
+    else:
+        real = sketch(args.real, lo=args.lo, hi=args.hi, bins=args.bins)
+        if args.merge:
+            fake = PixelHistogram.load(args.merge[0])
+            for path in args.merge[1:]:
+                fake.merge(PixelHistogram.load(path))
+        else:
+            fake = sketch(args.fake, lo=args.lo, hi=args.hi, bins=args.bins)
+        result = compare(real, fake, args.q)
+        np.savez(args.out + '.npz', **result)
+        plot(result, args.out + '.png')
+        for j, q in enumerate(result['q']):
+            print('q', q, 'mean |diff|', np.abs(result['diff'][j]).mean(),
+                  'fake exceedance', result['fake_exceedance'][j].mean(), 'expected', 1 - q)
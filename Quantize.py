@@ -0,0 +1,147 @@
+import argparse
+import copy
+import os
+import time
+import numpy as np
+import torch
+import torch.nn as nn
+from scipy.stats import genpareto
+import RNGStreams
+from Extremeness import AvgExtremeness
+from Models import load_generator, load_pggan
+from Frechet import frechet_distance
+
+genpareto_params = (1.33, 0, 0.0075761900937239765)
+threshold = -0.946046018600464
+rv = genpareto(*genpareto_params)
+
+
+class QuantizedGenerator(nn.Module):
+    """
+    Int8 wrapper around a (conditional) Generator: activations are quantized
+    after the latent (and code) is assembled and dequantized before tanh.
+    """
+
+    def __init__(self, G, conditional=False):
+        super(QuantizedGenerator, self).__init__()
+        self.conditional = conditional
+        self.quant = torch.quantization.QuantStub()
+        self.block1 = G.block1
+        self.block2 = G.block2
+        self.block3 = G.block3
+        self.block4 = G.block4
+        self.block5 = G.block5
+        self.dequant = torch.quantization.DeQuantStub()
+
+    def forward(self, latent, continuous_code=None):
+        if self.conditional:
+            latent = torch.cat((latent, continuous_code), 1)
+        out = self.quant(latent)
+        out = self.block1(out)
+        out = self.block2(out)
+        out = self.block3(out)
+        out = self.block4(out)
+        out = self.block5(out)
+        return torch.tanh(self.dequant(out))
+
+
+def calibration_inputs(n, latentdim=20, conditional=False, seed=1234):
+    latent = RNGStreams.latents(seed, np.arange(n), latentdim)
+    if not conditional:
+        return latent, None
+    u = RNGStreams.uniforms(seed, RNGStreams.CODE, np.arange(n), 1)[:, 0]
+    code = torch.as_tensor(rv.ppf(u * 0.95) + threshold, dtype=torch.float32).view(-1, 1, 1, 1)
+    return latent, code
+
+
+def quantize_generator(G, latentdim=20, conditional=False, calibration=1024, batch_size=256, backend='fbgemm'):
+    """
+    Static post-training int8 quantization of a float Generator, calibrated on latent samples.
+    ConvTranspose2d only supports per-tensor weight observers, so weights use per-tensor scales.
+    """
+    torch.backends.quantized.engine = backend
+    Gq = QuantizedGenerator(copy.deepcopy(G).cpu().eval(), conditional).eval()
+    Gq.qconfig = torch.quantization.QConfig(
+        activation=torch.quantization.HistogramObserver.with_args(reduce_range=True),
+        weight=torch.quantization.default_weight_observer)
+    torch.quantization.prepare(Gq, inplace=True)
+    latent, code = calibration_inputs(calibration, latentdim, conditional)
+    with torch.no_grad():
+        for i in range(0, calibration, batch_size):
+            Gq(latent[i:i + batch_size], None if code is None else code[i:i + batch_size])
+    torch.quantization.convert(Gq, inplace=True)
+    return Gq
+
+
+def frechet(x, y):
+    return frechet_distance(x.mean(0), y.mean(0), np.cov(x, rowvar=False), np.cov(y, rowvar=False))
+
+
+def accuracy_guard(G, Gq, latentdim=20, conditional=False, n=2048, max_extreme_err=0.02, max_frechet=0.05):
+    """
+    Compares float and int8 outputs on held-out latents: relative error of the
+    extremeness score of every sample, and the Frechet distance between the
+    two output distributions on 8x8 average-pooled fields.
+    """
+    criterion = AvgExtremeness()
+    latent, code = calibration_inputs(n, latentdim, conditional, seed=4321)
+    args = (latent,) if code is None else (latent, code)
+    with torch.no_grad():
+        ref = G.cpu().eval()(*args)
+        out = Gq(*args)
+    s_ref, s_out = criterion.cal_extreme(ref), criterion.cal_extreme(out)
+    extreme_err = float((torch.abs(s_out - s_ref) / torch.abs(s_ref).clamp(min=1e-6)).mean())
+    pool = nn.AdaptiveAvgPool2d(8)
+    fd = frechet(pool(ref).view(n, -1).numpy().astype(np.float64), pool(out).view(n, -1).numpy().astype(np.float64))
+    return {
+        'extreme_rel_err': extreme_err,
+        'extreme_max_abs_err': float(torch.abs(s_out - s_ref).max()),
+        'frechet_8x8': fd,
+        'passed': extreme_err <= max_extreme_err and fd <= max_frechet,
+    }
+
+
+def benchmark(G, Gq, latentdim=20, conditional=False, batch_sizes=(1, 16, 128), repeats=20):
+    results = {}
+    for batch_size in batch_sizes:
+        latent, code = calibration_inputs(batch_size, latentdim, conditional)
+        args = (latent,) if code is None else (latent, code)
+        row = {}
+        for name, model in [('float32', G.cpu().eval()), ('int8', Gq)]:
+            with torch.no_grad():
+                model(*args)
+                t = time.time()
+                for _ in range(repeats):
+                    model(*args)
+            row[name + '_ms'] = (time.time() - t) / repeats * 1000
+        row['speedup'] = row['float32_ms'] / row['int8_ms']
+        results[batch_size] = row
+        print('batch', batch_size, row)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Quantize')
+    parser.add_argument('--kind', default='dcgan', choices=['dcgan', 'exgan', 'pggan'])
+    parser.add_argument('--save', default='', type=str, help='run directory holding the checkpoints')
+    parser.add_argument('--calibration', default=1024, type=int)
+    parser.add_argument('--threads', default=None, type=int)
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    conditional = args.kind == 'exgan'
+    if args.kind == 'pggan':
+        G = load_pggan(args.save, device='cpu').G
+    else:
+        G = load_generator(args.kind, args.save, device='cpu')
+    Gq = quantize_generator(G, conditional=conditional, calibration=args.calibration)
+    report = accuracy_guard(G, Gq, conditional=conditional)
+    print(report)
+    benchmark(G, Gq, conditional=conditional)
+    if report['passed']:
+        latent, code = calibration_inputs(1, conditional=conditional)
+        example = (latent,) if code is None else (latent, code)
+        torch.jit.save(torch.jit.trace(Gq, example), os.path.join(args.save, 'G_int8.pt'))
+    else:
+        print('int8 generator failed the accuracy guard, keeping float32')
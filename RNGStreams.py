@@ -0,0 +1,62 @@
+import numpy as np
+try:
+    import torch
+except ImportError:
+    # the numpy streams are also used by ONNXSampling.py, which runs without torch
+    torch = None
+
+# bump when the counter scheme changes, anything persisting sample ids depends on it
+VERSION = 1
+# stream ids, so the latent and the noise of one sample never share draws
+LATENT, EXPONENTIAL, CODE = 0, 1, 2
+
+GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+MIX1 = np.uint64(0xBF58476D1CE4E5B9)
+MIX2 = np.uint64(0x94D049BB133111EB)
+
+
+def splitmix64(x):
+    with np.errstate(over='ignore'):
+        z = x + GOLDEN
+        z = (z ^ (z >> np.uint64(30))) * MIX1
+        z = (z ^ (z >> np.uint64(27))) * MIX2
+        return z ^ (z >> np.uint64(31))
+
+
+def uniforms(seed, stream, index, width):
+    """
+    Uniforms in (0, 1) of shape (len(index), width). Entry (i, j) is a pure
+    function of (seed, stream, index[i], j), so any subset of samples can be
+    regenerated alone and in any order.
+    """
+    index = np.asarray(index, dtype=np.uint64).reshape(-1, 1)
+    key = splitmix64(splitmix64(np.uint64(seed)) ^ np.uint64(stream))
+    with np.errstate(over='ignore'):
+        row = splitmix64(key + splitmix64(index))
+        z = splitmix64(row + np.arange(width, dtype=np.uint64).reshape(1, -1))
+    return ((z >> np.uint64(11)).astype(np.float64) + 0.5) * 2.0 ** -53
+
+
+def normals(seed, stream, index, width):
+    """
+    Standard normals of shape (len(index), width), same counter scheme as uniforms.
+    """
+    u = uniforms(seed, stream, index, 2 * width)
+    return np.sqrt(-2.0 * np.log(u[:, :width])) * np.cos(2.0 * np.pi * u[:, width:])
+
+
+def latent_array(seed, index, latentdim):
+    return normals(seed, LATENT, index, latentdim).astype(np.float32).reshape(-1, latentdim, 1, 1)
+
+
+def exponential_array(seed, index, shape):
+    e = -np.log(uniforms(seed, EXPONENTIAL, index, int(np.prod(shape))))
+    return e.astype(np.float32).reshape(-1, *shape)
+
+
+def latents(seed, index, latentdim):
+    return torch.from_numpy(latent_array(seed, index, latentdim))
+
+
+def exponentials(seed, index, shape):
+    return torch.from_numpy(exponential_array(seed, index, shape))
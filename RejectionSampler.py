@@ -0,0 +1,91 @@
+import math
+import time
+import torch
+from Extremeness import AvgExtremeness
+
+
+def bytes_per_sample(G, latentdim, device='cuda'):
+    """
+    Rough activation footprint of one forward pass, summed over leaf modules.
+    """
+    total = [0]
+
+    def hook(module, inp, out):
+        total[0] += out.numel() * out.element_size()
+
+    handles = [m.register_forward_hook(hook) for m in G.modules() if len(list(m.children())) == 0]
+    with torch.no_grad():
+        G(torch.randn(1, latentdim, 1, 1).to(device))
+    for h in handles:
+        h.remove()
+    return total[0]
+
+
+class RejectionSampler:
+    """
+    Draws samples from G whose extremeness is >= val.
+    The acceptance rate starts from a prior (e.g. tau from the fitted tail) and
+    is updated after every pass; each batch is sized so that the expected
+    number of accepted samples covers what is still missing, capped so the
+    batch fits in `memory_mb`. Sampling gives up after `max_draws` latents,
+    returning what was accepted so far, so a val beyond what G can produce
+    does not loop forever.
+    """
+
+    def __init__(self, G, latentdim, criterion=None, device='cuda', memory_mb=1024,
+                 min_batch=64, prior_strength=100, safety=1.25, max_draws=10 ** 8):
+        self.G = G
+        self.latentdim = latentdim
+        self.criterion = criterion if criterion is not None else AvgExtremeness()
+        self.device = device
+        self.min_batch = min_batch
+        self.max_batch = max(min_batch, int(memory_mb * 2 ** 20 // bytes_per_sample(G, latentdim, device)))
+        self.prior_strength = prior_strength
+        self.safety = safety
+        self.max_draws = max_draws
+
+    def rate(self, accepted, drawn, prior_rate):
+        return (accepted + prior_rate * self.prior_strength) / (drawn + self.prior_strength)
+
+    def batch_size(self, remaining, rate):
+        size = int(math.ceil(self.safety * remaining / max(rate, 1e-12)))
+        return min(max(size, self.min_batch), self.max_batch)
+
+    def sample(self, val, count, prior_rate=0.5, max_draws=None):
+        """
+        Up to count samples with extremeness >= val and the sampling stats;
+        stats['complete'] is False when max_draws ran out first.
+        """
+        max_draws = max_draws if max_draws is not None else self.max_draws
+        images = []
+        accepted, drawn, passes = 0, 0, 0
+        t = time.time()
+        with torch.no_grad():
+            while accepted < count and drawn < max_draws:
+                size = self.batch_size(count - accepted, self.rate(accepted, drawn, prior_rate))
+                size = min(size, max_draws - drawn)
+                latent = torch.randn(size, self.latentdim, 1, 1).to(self.device)
+                image = self.G(latent)
+                keep = self.criterion.cal_extreme(image) >= val
+                n_keep = int(keep.sum())
+                if n_keep > 0:
+                    images.append(image[keep].cpu())
+                accepted += n_keep
+                drawn += size
+                passes += 1
+        elapsed = time.time() - t
+        stats = {
+            'accepted': min(accepted, max(count, 0)),
+            'drawn': drawn,
+            'passes': passes,
+            'complete': accepted >= count,
+            'acceptance_rate': accepted / drawn if drawn > 0 else float('nan'),
+            'passes_per_sample': passes / accepted if accepted > 0 else float('inf'),
+            'samples_per_sec': min(accepted, max(count, 0)) / elapsed if elapsed > 0 else 0.0,
+            'time': elapsed,
+        }
+        if not images:
+            with torch.no_grad():
+                shape = self.G(torch.zeros(1, self.latentdim, 1, 1).to(self.device)).shape[1:]
+            return torch.empty((0,) + tuple(shape)), stats
+        return torch.cat(images, 0)[:count], stats
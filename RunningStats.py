@@ -0,0 +1,50 @@
+import numpy as np
+
+
+class RunningStats:
+    """
+    Streaming mean and covariance of feature vectors in float64.
+    Batches are folded in with the pairwise (Chan et al.) form of Welford's
+    update, and partial states from several workers combine with merge().
+    """
+
+    def __init__(self, dim):
+        self.dim = dim
+        self.count = 0
+        self.mean = np.zeros(dim, dtype=np.float64)
+        self.m2 = np.zeros((dim, dim), dtype=np.float64)
+
+    def combine(self, count, mean, m2):
+        if count == 0:
+            return self
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean = self.mean + delta * (count / total)
+        self.m2 = self.m2 + m2 + np.outer(delta, delta) * (self.count * count / total)
+        self.count = total
+        return self
+
+    def update(self, features):
+        features = np.asarray(features, dtype=np.float64).reshape(-1, self.dim)
+        if len(features) == 0:
+            return self
+        mean = features.mean(0)
+        centered = features - mean
+        return self.combine(len(features), mean, centered.T.dot(centered))
+
+    def merge(self, other):
+        return self.combine(other.count, other.mean, other.m2)
+
+    @property
+    def cov(self):
+        return self.m2 / max(self.count - 1, 1)
+
+    def save(self, path):
+        np.savez(path, count=self.count, mean=self.mean, m2=self.m2)
+
+    @classmethod
+    def load(cls, path):
+        state = np.load(path)
+        stats = cls(len(state['mean']))
+        stats.count, stats.mean, stats.m2 = int(state['count']), state['mean'], state['m2']
+        return stats
@@ -0,0 +1,168 @@
+import hashlib
+import json
+import os
+import numpy as np
+import torch
+from Extremeness import AvgExtremeness
+from StageCache import file_digest
+
+INDEX_DTYPE = np.dtype([('seed', '<i8'), ('tau', '<f4'), ('score', '<f4')])
+
+
+class ShardWriter:
+    """
+    Appends sample batches to fixed-size memory-mapped .npy shards as they are
+    produced, with an index of (seed, tau, score) per sample, so the number of
+    samples is bounded by disk rather than RAM. When the total number of
+    samples is known, shards are sized to what is left so the last one is
+    not allocated full size and copied to trim it. meta.json, which marks the
+    store complete, is only written when the writer exits without an error.
+    """
+
+    def __init__(self, root, sample_shape, shard_size=65536, criterion=None, meta=None, total=None):
+        self.root = root
+        self.expected = total
+        self.meta = meta if meta is not None else {}
+        self.sample_shape = tuple(sample_shape)
+        self.shard_size = shard_size
+        self.criterion = criterion if criterion is not None else AvgExtremeness()
+        self.shards = []
+        self.total = 0
+        self.shard = None
+        self.index = None
+        self.fill = 0
+        os.makedirs(root, exist_ok=True)
+
+    def shard_path(self, i, suffix=''):
+        return os.path.join(self.root, 'shard{:05d}{}.npy'.format(i, suffix))
+
+    def open_shard(self):
+        i = len(self.shards)
+        size = self.shard_size
+        if self.expected is not None and self.expected > sum(self.shards):
+            size = min(size, self.expected - sum(self.shards))
+        self.shard = np.lib.format.open_memmap(self.shard_path(i), mode='w+', dtype=np.float32,
+                                               shape=(size,) + self.sample_shape)
+        self.index = np.empty(size, dtype=INDEX_DTYPE)
+        self.fill = 0
+
+    def close_shard(self):
+        i = len(self.shards)
+        if self.fill < len(self.shard):
+            data = np.lib.format.open_memmap(self.shard_path(i, '.tmp'), mode='w+', dtype=np.float32,
+                                             shape=(self.fill,) + self.sample_shape)
+            data[:] = self.shard[:self.fill]
+            data.flush()
+            del data
+            self.shard = None
+            os.replace(self.shard_path(i, '.tmp'), self.shard_path(i))
+        else:
+            self.shard.flush()
+            self.shard = None
+        np.save(self.shard_path(i, '.index'), self.index[:self.fill])
+        self.shards.append(self.fill)
+
+    def write(self, images, seeds=None, tau=float('nan'), scores=None):
+        n = len(images)
+        if scores is None:
+            scores = self.criterion.cal_extreme(images)
+        images = images.detach().cpu().numpy() if torch.is_tensor(images) else np.asarray(images)
+        scores = scores.detach().cpu().numpy() if torch.is_tensor(scores) else np.asarray(scores)
+        seeds = np.full(n, -1, dtype=np.int64) if seeds is None else np.asarray(seeds)
+        taus = np.broadcast_to(np.asarray(tau, dtype=np.float32), (n,))
+        done = 0
+        while done < n:
+            if self.shard is None:
+                self.open_shard()
+            size = min(n - done, len(self.shard) - self.fill)
+            rows = slice(self.fill, self.fill + size)
+            self.shard[rows] = images[done:done + size]
+            self.index['seed'][rows] = seeds[done:done + size]
+            self.index['tau'][rows] = taus[done:done + size]
+            self.index['score'][rows] = scores[done:done + size]
+            self.fill += size
+            done += size
+            if self.fill == len(self.shard):
+                self.close_shard()
+        self.total += n
+
+    def close(self):
+        if self.shard is not None and self.fill > 0:
+            self.close_shard()
+        with open(os.path.join(self.root, 'meta.json'), 'w') as f:
+            meta = dict(self.meta, shards=self.shards, total=self.total, sample_shape=list(self.sample_shape))
+            json.dump(meta, f)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if exc[0] is None:
+            self.close()
+        else:
+            # leave the partial shards but no meta.json, so the store never reads as complete
+            self.shard = None
+
+
+class SampleStore:
+    """
+    Read side of ShardWriter, every shard is opened as a read-only memmap.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        with open(os.path.join(root, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.shards = [np.load(os.path.join(root, 'shard{:05d}.npy'.format(i)), mmap_mode='r')
+                       for i in range(len(self.meta['shards']))]
+        self.offsets = np.cumsum([0] + self.meta['shards'])
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def __getitem__(self, item):
+        shard = int(np.searchsorted(self.offsets, item, side='right')) - 1
+        return torch.from_numpy(np.array(self.shards[shard][item - self.offsets[shard]]))
+
+    def index(self):
+        return np.concatenate([np.load(os.path.join(self.root, 'shard{:05d}.index.npy'.format(i)))
+                               for i in range(len(self.shards))])
+
+    def iter_batches(self, batch_size=4096):
+        """
+        Yields float32 numpy batches without loading more than one batch.
+        """
+        for shard in self.shards:
+            for i in range(0, len(shard), batch_size):
+                yield np.asarray(shard[i:i + batch_size])
+
+
+def data_digest(path):
+    """
+    Content hash of a tensor file, or of a SampleStore folder through its meta
+    and index files.
+    """
+    if os.path.isdir(path):
+        h = hashlib.sha1(file_digest(os.path.join(path, 'meta.json')).encode())
+        for name in sorted(os.listdir(path)):
+            if name.endswith('.index.npy'):
+                h.update(file_digest(os.path.join(path, name)).encode())
+        return h.hexdigest()
+    return file_digest(path)
+
+
+def fields(path, batch_size=4096, unit=False):
+    """
+    Numpy batches of fields on the [-1, 1] scale of data/real.pt from a tensor
+    file or a SampleStore folder, which holds them rescaled to [0, 1]. unit
+    marks a tensor file saved as 0.5 * (x + 1), like the ExGANSampling.py and
+    PGGAN_sampling.py outputs.
+    """
+    if os.path.isdir(path):
+        for batch in SampleStore(path).iter_batches(batch_size):
+            yield 2 * batch - 1
+        return
+    data = torch.load(path, map_location='cpu')
+    for i in range(0, len(data), batch_size):
+        batch = data[i:i + batch_size].numpy()
+        yield 2 * batch - 1 if unit else batch
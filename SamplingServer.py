@@ -0,0 +1,231 @@
+import argparse
+import asyncio
+import base64
+import collections
+import json
+import time
+import numpy as np
+import torch
+from scipy.stats import genpareto
+from ConditionalSampling import tau_to_val
+from Models import load_generator, load_pggan
+
+genpareto_params = (1.33, 0, 0.0075761900937239765)
+threshold = -0.946046018600464
+rv = genpareto(*genpareto_params)
+
+
+class ModelRunner:
+    """
+    Keeps one trained model resident and turns a list of requests into a single
+    forward pass. Every request is a dict with n and, for exgan, tau.
+    Outputs are rescaled to [0, 1].
+    """
+
+    def __init__(self, kind, dirname, model='finetune', simple=False, latentdim=20, c=0.75, k=10, device='cuda'):
+        self.kind = kind
+        self.latentdim = latentdim
+        self.c = c
+        self.k = k
+        self.device = device
+        if kind == 'pggan':
+            self.model = load_pggan(dirname, model, simple, latentdim, device=device)
+            self.e = torch.distributions.exponential.Exponential(torch.ones([1] + list(self.model.sigma.shape)))
+        else:
+            self.model = load_generator(kind, dirname, latentdim, device=device)
+
+    def check(self, request, max_request):
+        """
+        Error message for a request this runner cannot serve, None otherwise.
+        Beyond tau = c**k the exgan code level is undefined.
+        """
+        if not 0 < request['n'] <= max_request:
+            return 'n must be in [1, {}]'.format(max_request)
+        if self.kind == 'exgan':
+            request['tau'] = float(request.get('tau', 0.05))
+            if not 0 < request['tau'] < self.c ** self.k:
+                return 'tau must be in (0, {})'.format(self.c ** self.k)
+        return None
+
+    def __call__(self, requests):
+        n = sum(r['n'] for r in requests)
+        latent = torch.randn(n, self.latentdim, 1, 1).to(self.device)
+        with torch.no_grad():
+            if self.kind == 'exgan':
+                vals = np.concatenate([np.repeat(tau_to_val([r.get('tau', 0.05)], rv, threshold, self.c, self.k), r['n'])
+                                       for r in requests])
+                code = torch.as_tensor(vals, dtype=torch.float32).view(-1, 1, 1, 1).to(self.device)
+                images = 0.5 * (self.model(latent, code) + 1)
+            elif self.kind == 'pggan':
+                e_samples = self.e.rsample([n]).view(n, 1, *self.model.sigma.shape).to(self.device)
+                images = self.model(latent, e_samples)
+            else:
+                images = 0.5 * (self.model(latent) + 1)
+        return images.cpu()
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent requests into one batch, waiting at most max_latency
+    seconds after the first request or until max_batch samples are queued.
+    """
+
+    def __init__(self, runner, max_batch=1024, max_latency=0.01, window=10000):
+        self.runner = runner
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self.queue = asyncio.Queue()
+        self.latencies = collections.deque(maxlen=window)
+        self.batch_sizes = collections.deque(maxlen=window)
+        self.samples = 0
+        self.requests = 0
+        self.start = time.time()
+
+    async def submit(self, request):
+        future = asyncio.get_event_loop().create_future()
+        await self.queue.put((request, future, time.time()))
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            batch = [await self.queue.get()]
+            total = batch[0][0]['n']
+            deadline = loop.time() + self.max_latency
+            while total < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(item)
+                total += item[0]['n']
+            try:
+                images = await loop.run_in_executor(None, self.runner, [item[0] for item in batch])
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            offset = 0
+            now = time.time()
+            for request, future, t in batch:
+                future.set_result(images[offset:offset + request['n']])
+                offset += request['n']
+                self.latencies.append(now - t)
+            self.batch_sizes.append(total)
+            self.samples += total
+            self.requests += len(batch)
+
+    def metrics(self):
+        latencies = np.asarray(self.latencies) * 1000
+        elapsed = time.time() - self.start
+        return {
+            'requests': self.requests,
+            'samples': self.samples,
+            'p50_ms': float(np.percentile(latencies, 50)) if len(latencies) else None,
+            'p99_ms': float(np.percentile(latencies, 99)) if len(latencies) else None,
+            'requests_per_sec': self.requests / elapsed,
+            'samples_per_sec': self.samples / elapsed,
+            'mean_batch': float(np.mean(self.batch_sizes)) if len(self.batch_sizes) else None,
+        }
+
+
+def encode(images):
+    data = images.numpy().astype('<f4')
+    return {'shape': list(data.shape), 'dtype': 'float32', 'data': base64.b64encode(data.tobytes()).decode()}
+
+
+async def respond(writer, status, body):
+    payload = json.dumps(body).encode()
+    writer.write('HTTP/1.1 {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\n\r\n'
+                 .format(status, len(payload)).encode() + payload)
+    await writer.drain()
+
+
+async def sample(batcher, body, max_request):
+    """
+    Status and body of a /sample request: 400 for a body that is not a valid
+    request, 500 when the model fails on the batch it was coalesced into.
+    """
+    try:
+        request = json.loads(body or b'{}')
+        request['n'] = int(request.get('n', 1))
+        error = batcher.runner.check(request, max_request)
+    except (ValueError, TypeError, AttributeError):
+        error = 'body must be a json object with an integer n and a numeric tau'
+    if error:
+        return '400 Bad Request', {'error': error}
+    try:
+        return '200 OK', encode(await batcher.submit(request))
+    except Exception as e:
+        return '500 Internal Server Error', {'error': repr(e)}
+
+
+def make_handler(batcher, max_request):
+    async def handle(reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    method, path, _ = line.decode().split(' ', 2)
+                    headers = {}
+                    while True:
+                        header = (await reader.readline()).decode().strip()
+                        if not header:
+                            break
+                        key, value = header.split(':', 1)
+                        headers[key.strip().lower()] = value.strip()
+                    length = int(headers.get('content-length', 0))
+                    if length < 0:
+                        raise ValueError(length)
+                except ValueError:
+                    # the stream cannot be resynchronized after a bad request head
+                    await respond(writer, '400 Bad Request', {'error': 'malformed request'})
+                    break
+                body = await reader.readexactly(length)
+                if method == 'GET' and path == '/metrics':
+                    await respond(writer, '200 OK', batcher.metrics())
+                elif method == 'POST' and path == '/sample':
+                    await respond(writer, *(await sample(batcher, body, max_request)))
+                else:
+                    await respond(writer, '404 Not Found', {'error': 'unknown route {} {}'.format(method, path)})
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+    return handle
+
+
+async def serve(args):
+    runner = ModelRunner(args.kind, args.save, args.model, args.simple, device=args.device)
+    batcher = MicroBatcher(runner, args.max_batch, args.max_latency_ms / 1000.0)
+    handler = make_handler(batcher, args.max_batch)
+    if args.socket:
+        server = await asyncio.start_unix_server(handler, path=args.socket)
+    else:
+        server = await asyncio.start_server(handler, args.host, args.port)
+    print('serving', args.kind, 'from', args.save, 'on', args.socket or '{}:{}'.format(args.host, args.port))
+    asyncio.ensure_future(batcher.run())
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='SamplingServer')
+    parser.add_argument('--kind', default='pggan', choices=['dcgan', 'exgan', 'pggan'])
+    parser.add_argument('--save', default='', type=str, help='run directory holding the checkpoints')
+    parser.add_argument('--model', default='finetune', type=str)
+    parser.add_argument('--simple', action='store_true', default=False)
+    parser.add_argument('--device', default='cuda', type=str)
+    parser.add_argument('--host', default='127.0.0.1', type=str)
+    parser.add_argument('--port', default=8765, type=int)
+    parser.add_argument('--socket', default='', type=str, help='serve on this unix socket instead of tcp')
+    parser.add_argument('--max_batch', default=1024, type=int)
+    parser.add_argument('--max_latency_ms', default=10.0, type=float)
+    asyncio.run(serve(parser.parse_args()))
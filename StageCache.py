@@ -0,0 +1,57 @@
+import hashlib
+import json
+import os
+import torch
+
+
+def file_digest(path, block_size=1 << 20):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def stage_key(parent, params):
+    """
+    Key of a stage: hash of its parent's key and its own hyperparameters, so a
+    stage is reused only if everything upstream of it is unchanged.
+    """
+    h = hashlib.sha1(parent.encode())
+    h.update(json.dumps(params, sort_keys=True).encode())
+    return h.hexdigest()[:16]
+
+
+class StageCache:
+    """
+    On-disk cache of distribution shifting stages, one directory per stage key.
+    meta.json is written last and marks the stage as complete.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, key, name=''):
+        return os.path.join(self.root, key, name)
+
+    def done(self, key):
+        return os.path.isfile(self.path(key, 'meta.json'))
+
+    def meta(self, key):
+        with open(self.path(key, 'meta.json')) as f:
+            return json.load(f)
+
+    def save(self, key, modules, meta):
+        os.makedirs(self.path(key), exist_ok=True)
+        for name, module in modules.items():
+            torch.save(module.state_dict(), self.path(key, name + '.pt'))
+        tmp = self.path(key, 'meta.json.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(meta, f, indent=2)
+        os.replace(tmp, self.path(key, 'meta.json'))
+
+    def load(self, key, modules):
+        for name, module in modules.items():
+            module.load_state_dict(torch.load(self.path(key, name + '.pt')))
+        return self.meta(key)
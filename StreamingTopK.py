@@ -0,0 +1,38 @@
+import torch
+from Extremeness import AvgExtremeness
+
+
+def stream_topk(G, total, keep, latentdim, criterion=None, chunk_size=512, device='cuda'):
+    """
+    Draw `total` samples from G in chunks of `chunk_size` and return the `keep`
+    most extreme ones and their scores on the CPU, sorted by decreasing
+    extremeness. Only `keep + chunk_size` samples are ever held at once.
+    """
+    if criterion is None:
+        criterion = AvgExtremeness()
+    keep = min(keep, total)
+    best_samples = torch.empty(0)
+    best_scores = torch.empty(0)
+    done = 0
+    with torch.no_grad():
+        while done < total:
+            size = min(chunk_size, total - done)
+            latent = torch.randn(size, latentdim, 1, 1).to(device)
+            samples = G(latent)
+            scores = criterion.cal_extreme(samples).cpu()
+            samples = samples.cpu()
+            if done > 0:
+                samples = torch.cat([best_samples, samples], 0)
+                scores = torch.cat([best_scores, scores], 0)
+            top = torch.topk(scores, min(keep, len(scores))).indices
+            best_samples, best_scores = samples[top], scores[top]
+            done += size
+    return best_samples, best_scores
+
+
+def save_topk(path, G, total, keep, latentdim, criterion=None, chunk_size=512, device='cuda', score_path=None):
+    samples, scores = stream_topk(G, total, keep, latentdim, criterion, chunk_size, device)
+    torch.save(samples, path)
+    if score_path is not None:
+        torch.save(scores, score_path)
+    return len(samples)